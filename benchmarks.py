@@ -0,0 +1,749 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import timeit
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lxml.etree
+import lxml.html
+
+import scrapper
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.replace('bench_', '')] = func
+    return func
+
+
+def generate_listing(entries=100, fields=5, next_link=None, first=0):
+    # generates listing page with ``entries`` entries, numbered from
+    # ``first``, each with ``fields`` paragraphs, that can be processed by
+    # ``make_item_class``, and optional link to the next page
+    rows = []
+    for entry in range(first, first + entries):
+        rows.append(
+            '<div class="entry"><h2><a href="/entry/{0}">Entry {0}</a></h2>'
+            '{1}</div>'.format(entry, ''.join(
+                '<p class="field-{0}">Value {0} of entry {1}</p>'.format(
+                    field, entry,
+                )
+                for field in range(fields)
+            ))
+        )
+
+    if next_link:
+        rows.append('<a class="next" href="{}">Next</a>'.format(next_link))
+
+    return (
+        '<!DOCTYPE html><html><head><title>Listing</title></head><body>'
+        '<div id="entries">{}</div></body></html>'.format(''.join(rows))
+    ).encode()
+
+
+def generate_site(pages=10, entries=100, fields=5):
+    # returns mapping of paths to contents of pages: ``/index.html`` links to
+    # all listings, ``/page/<n>.html`` are listings linked one to another and
+    # ``/entry/<n>.html`` are pages with single entry
+    site = {'/index.html': (
+        '<html><body>{}</body></html>'.format(''.join(
+            '<a class="page" href="/page/{0}.html">{0}</a>'.format(page)
+            for page in range(pages)
+        ))
+    ).encode()}
+
+    for page in range(pages):
+        site['/page/%d.html' % page] = generate_listing(
+            entries, fields,
+            '/page/%d.html' % (page + 1) if page + 1 < pages else None,
+        )
+        site['/entry/%d.html' % page] = generate_listing(1, fields)
+
+    return site
+
+
+def generate_feed(newest, pages=10, entries=100, fields=5):
+    # returns mapping of paths to listings ``/page/<n>.html`` of newest-first
+    # feed, where first page starts with entry ``newest``
+    return {
+        '/page/%d.html' % page: generate_listing(
+            entries, fields,
+            '/page/%d.html' % (page + 1) if page + 1 < pages else None,
+            newest - (page + 1) * entries + 1,
+        )
+        for page in range(pages)
+    }
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately, don't wait for ACK between them
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        content = self.server.site.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_site(site):
+    # serves pages from ``generate_site`` over HTTP, yields base url
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SiteHandler)
+    server.daemon_threads = True
+    server.site = site
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        yield 'http://127.0.0.1:%d' % server.server_port
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_item_class(fields=5, name='BenchEntry'):
+    attrs = {
+        'title': scrapper.Field('//h2/a/text()'),
+        'link': scrapper.Field('//h2/a/@href'),
+    }
+    for field in range(fields):
+        attrs['field_%d' % field] = scrapper.Field(
+            '//p[@class="field-%d"]/text()' % field,
+            lambda value, _, __: value.strip() if value else None,
+        )
+
+    return type(name, (scrapper.Item,), attrs)
+
+
+def make_item_set_class(item_class, name='BenchEntries'):
+    return type(name, (scrapper.ItemSet,), {
+        'item_class': item_class,
+        'content_selector': '//div[@class="entry"]',
+    })
+
+
+# classes used by worker processes need to be importable
+PipelineEntry = make_item_class(name='PipelineEntry')
+PipelineEntries = make_item_set_class(PipelineEntry, 'PipelineEntries')
+
+
+def timed(func, repeat=5, number=1):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def percentile(values, percent):
+    # nearest-rank percentile of sorted values
+    index = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def measure_crawl(crawl):
+    # ``crawl`` returns generator yielding number of records of every page it
+    # processed, time between pages is their latency, peak memory is measured
+    # in separate run, since tracing slows everything down
+    latencies = []
+    records = 0
+    start = last = timeit.default_timer()
+    for count in crawl():
+        now = timeit.default_timer()
+        latencies.append(now - last)
+        last = now
+        records += count
+    elapsed = last - start
+
+    tracemalloc.start()
+    for _ in crawl():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'pages': len(latencies),
+        'records': records,
+        'pages_per_s': len(latencies) / elapsed,
+        'records_per_s': records / elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 50) * 1e3,
+            'p90': percentile(latencies, 90) * 1e3,
+            'p99': percentile(latencies, 99) * 1e3,
+            'max': latencies[-1] * 1e3,
+        },
+        'peak_kb': peak / 1024,
+    }
+
+
+@benchmark
+def bench_field_extraction(entries=100, fields=5):
+    # per-item cost of evaluating fields using raw string selectors, like it
+    # was done before selectors were compiled, and using compiled ``Field``
+    item_class = make_item_class(fields)
+    item_fields = [
+        field for field in vars(item_class).values()
+        if isinstance(field, scrapper.Field)
+    ]
+    parsed = lxml.html.fromstring(generate_listing(entries, fields))
+    elements = [
+        lxml.html.fromstring(lxml.etree.tostring(element))
+        for element in parsed.xpath('//div[@class="entry"]')
+    ]
+
+    def raw():
+        for element in elements:
+            for field in item_fields:
+                value = element.xpath(field.selector)
+                value = value[0] if value else None
+                if field.callback:
+                    field.callback(value, element, None)
+
+    def compiled():
+        for element in elements:
+            for field in item_fields:
+                field.process(element, None)
+
+    raw_time = timed(raw)
+    compiled_time = timed(compiled)
+
+    return {
+        'entries': entries,
+        'fields': len(item_fields),
+        'raw_per_item_us': raw_time / entries * 1e6,
+        'compiled_per_item_us': compiled_time / entries * 1e6,
+        'speedup': raw_time / compiled_time,
+    }
+
+
+@benchmark
+def bench_extract_many(entries=100, fields=5):
+    # records per second of creating ``Item`` for every stored page, and of
+    # extracting them all at once with ``Item.extract_many``
+    item_class = make_item_class(fields)
+    documents = [
+        ('http://localhost/entry/%d' % entry, generate_listing(1, fields))
+        for entry in range(entries)
+    ]
+
+    items_time = timed(lambda: [
+        item_class(url, content=content).as_dict()
+        for url, content in documents
+    ])
+    records_time = timed(lambda: item_class.extract_many(documents))
+    columns_time = timed(
+        lambda: item_class.extract_many(documents, columns=True),
+    )
+
+    return {
+        'documents': entries,
+        'items_per_s': entries / items_time,
+        'extract_many_per_s': entries / records_time,
+        'extract_many_columns_per_s': entries / columns_time,
+        'speedup': items_time / records_time,
+    }
+
+
+@benchmark
+def bench_parser(entries=100, fields=5):
+    # parsing of listing with default parser, and with parser shared by
+    # ``parse_content``, decoding page with encoding known from headers
+    content = generate_listing(entries, fields)
+    response = type('Response', (object,), {
+        'headers': {'Content-Type': 'text/html; charset=utf-8'},
+    })()
+
+    default_time = timed(lambda: lxml.html.fromstring(content), number=20)
+    shared_time = timed(
+        lambda: scrapper.parse_content(content, response), number=20,
+    )
+
+    return {
+        'bytes': len(content),
+        'default_ms': default_time * 1e3,
+        'shared_ms': shared_time * 1e3,
+        'speedup': default_time / shared_time,
+    }
+
+
+def generate_wykop(entries=100, fields=5):
+    # generates page like listing of wykop.pl, every entry has ``fields``
+    # paragraphs inside of ``div.lcontrast``
+    rows = []
+    for entry in range(entries):
+        rows.append(
+            '<li class="link iC"><div class="article clearfix">'
+            '<div class="lcontrast m-reset"><h2><a href="/link/{0}">'
+            'Entry {0}</a></h2>{1}</div></div></li>'.format(entry, ''.join(
+                '<p class="field-{0}">Value {0} of entry {1}</p>'.format(
+                    field, entry,
+                )
+                for field in range(fields)
+            ))
+        )
+
+    return (
+        '<!DOCTYPE html><html><head><title>Wykop</title></head><body>'
+        '<ul id="itemsStream">{}</ul></body></html>'.format(''.join(rows))
+    ).encode()
+
+
+def make_wykop_item_class(fields=5):
+    prefix = '//div[contains(@class, "lcontrast")]'
+    attrs = {
+        'title': scrapper.Field(
+            prefix + '/h2/a/text()',
+            lambda value, _, __: value.strip() if value else None,
+        ),
+        'link': scrapper.Field(prefix + '/h2/a/@href'),
+    }
+    for field in range(fields):
+        attrs['field_%d' % field] = scrapper.Field(
+            prefix + '/p[@class="field-%d"]/text()' % field,
+        )
+
+    return type('WykopEntry', (scrapper.Item,), attrs)
+
+
+@benchmark
+def bench_extraction_plan(entries=100, fields=5):
+    # fields with common prefix of selectors evaluated one by one, and
+    # together by ``ExtractionPlan``, on whole page and on its entries
+    item_class = make_wykop_item_class(max(fields, 13))
+    item_set_class = type('WykopEntries', (scrapper.ItemSet,), {
+        'item_class': item_class,
+        'content_selector':
+            '//*[@id="itemsStream"]/li[contains(@class, "link")]',
+    })
+    content = generate_wykop(entries, max(fields, 13))
+    parsed = lxml.html.fromstring(content)
+    plan = item_class._plan
+    results = {}
+
+    for name, extract in (
+            ('page', lambda: item_class('http://localhost/', content=parsed)),
+            ('entries', lambda: [
+                item.as_dict()
+                for item in item_set_class('http://localhost/', content=parsed)
+            ])):
+        item_class._plan = None
+        per_field = timed(extract)
+        item_class._plan = plan
+        planned = timed(extract)
+
+        results[name] = {
+            'per_field_ms': per_field * 1e3,
+            'planned_ms': planned * 1e3,
+            'speedup': per_field / planned,
+        }
+
+    results['fields'] = len(item_class._field_names)
+    return results
+
+
+@benchmark
+def bench_item_memory(entries=100, fields=5):
+    # memory held by items extracted from large listing, and peak memory
+    # during extraction, items keep only element they were created from
+    item_set_class = make_item_set_class(make_item_class(fields))
+    content = generate_listing(entries * 100, fields)
+
+    tracemalloc.start()
+    items = list(item_set_class('http://localhost/', content=content))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'items': len(items),
+        'fields': len(items[0].as_dict()),
+        'current_kb': current / 1024,
+        'peak_kb': peak / 1024,
+        'bytes_per_item': current / len(items),
+    }
+
+
+@benchmark
+def bench_process_pipeline(entries=100, fields=5, pages=64, workers=None):
+    # extraction of records from many pages, in this process and in
+    # ``ProcessPipeline``, item classes have to be importable by workers
+    documents = [
+        ('http://localhost/%d' % page, generate_listing(entries, fields))
+        for page in range(pages)
+    ]
+
+    start = timeit.default_timer()
+    serial = sum(
+        1 for url, content in documents
+        for _ in scrapper.iter_records(PipelineEntries(url, content=content))
+    )
+    serial_time = timeit.default_timer() - start
+
+    with scrapper.ProcessPipeline(
+        PipelineEntries, workers=workers, batch_size=4,
+    ) as pipeline:
+        start = timeit.default_timer()
+        parallel = sum(1 for _ in pipeline.extract(documents))
+        parallel_time = timeit.default_timer() - start
+
+    assert serial == parallel
+
+    return {
+        'pages': pages,
+        'records': serial,
+        'workers': pipeline.workers,
+        'serial_records_per_s': serial / serial_time,
+        'pipeline_records_per_s': parallel / parallel_time,
+        'speedup': serial_time / parallel_time,
+    }
+
+
+@benchmark
+def bench_export_memory(entries=100, fields=5, page_counts=(10, 100)):
+    # peak memory of streaming records from growing number of pages to sink,
+    # it should stay the same no matter how many pages are processed
+    item_set_class = make_item_set_class(make_item_class(fields))
+    content = generate_listing(entries, fields)
+    results = {}
+
+    for count in page_counts:
+        item_sets = (
+            item_set_class('http://localhost/%d' % page, content=content)
+            for page in range(count)
+        )
+        sink = scrapper.JSONLinesSink(os.devnull)
+
+        tracemalloc.start()
+        start = timeit.default_timer()
+        records = scrapper.export(item_sets, sink)
+        sink.close()
+        elapsed = timeit.default_timer() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[str(count)] = {
+            'records': records,
+            'peak_kb': peak / 1024,
+            'records_per_s': records / elapsed,
+        }
+
+    return results
+
+
+@benchmark
+def bench_streaming(entries=100, fields=5):
+    # time to first item and peak memory of iterating over large page, when
+    # it's parsed at once and when it's parsed in chunks
+    item_class = make_item_class(fields)
+    content = generate_listing(entries * 100, fields)
+    results = {}
+
+    for streaming in (False, True):
+        item_set_class = type('BenchEntries', (scrapper.ItemSet,), {
+            'item_class': item_class,
+            'content_selector': '//div[@class="entry"]',
+            'streaming': streaming,
+        })
+
+        tracemalloc.start()
+        start = timeit.default_timer()
+        items = iter(item_set_class('http://localhost/', content=content))
+        next(items).as_dict()
+        first = timeit.default_timer() - start
+        count = 1 + sum(1 for item in items if item.as_dict())
+        elapsed = timeit.default_timer() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results['streaming' if streaming else 'regular'] = {
+            'items': count,
+            'first_item_ms': first * 1e3,
+            'items_per_s': count / elapsed,
+            'peak_kb': peak / 1024,
+        }
+
+    return results
+
+
+@benchmark
+def bench_stats_overhead(entries=100, fields=5):
+    # cost of extracting items with ``STATS`` disabled and enabled
+    item_set_class = make_item_set_class(make_item_class(fields))
+    content = generate_listing(entries, fields)
+
+    def extract():
+        for item in item_set_class('http://localhost/', content=content):
+            item.as_dict()
+
+    disabled = timed(extract)
+    scrapper.STATS = scrapper.Stats()
+    try:
+        enabled = timed(extract)
+    finally:
+        scrapper.STATS = None
+
+    return {
+        'items': entries,
+        'disabled_per_item_us': disabled / entries * 1e6,
+        'enabled_per_item_us': enabled / entries * 1e6,
+        'overhead': enabled / disabled - 1,
+    }
+
+
+@benchmark
+def bench_crawl(entries=100, fields=5, pages=20):
+    # fetching, parsing and extraction of pages served over HTTP from this
+    # process, by ``Item``, ``ItemSet`` and both modes of ``Pagination``
+    item_class = make_item_class(fields)
+    item_set_class = make_item_set_class(item_class)
+    site = generate_site(pages, entries, fields)
+    results = {}
+
+    with serve_site(site) as base_url, scrapper.Fetcher(
+        rate_limiter=scrapper.RateLimiter(rate=0),
+    ) as fetcher:
+        def items():
+            for page in range(pages):
+                url = '%s/entry/%d.html' % (base_url, page)
+                item_class(url, fetcher=fetcher).as_dict()
+                yield 1
+
+        def item_sets():
+            for page in range(pages):
+                url = '%s/page/%d.html' % (base_url, page)
+                yield sum(
+                    1 for item in item_set_class(url, fetcher=fetcher)
+                    if item.as_dict()
+                )
+
+        def paginate(**attrs):
+            pagination_class = type('BenchPagination', (scrapper.Pagination,),
+                                    dict(attrs, item_class=item_set_class))
+
+            def crawl():
+                try:
+                    for item_set in pagination_class(fetcher):
+                        yield sum(1 for item in item_set if item.as_dict())
+                except scrapper.ScrapperCantFindNext:
+                    # ``next_selector`` mode ends at page without next link
+                    pass
+
+            return crawl
+
+        results['item'] = measure_crawl(items)
+        results['item_set'] = measure_crawl(item_sets)
+        results['pagination_links'] = measure_crawl(paginate(
+            url=base_url + '/index.html',
+            links_selector='//a[@class="page"]/@href',
+        ))
+        results['pagination_next'] = measure_crawl(paginate(
+            url=base_url + '/page/0.html',
+            next_selector='//a[@class="next"]/@href',
+        ))
+
+    for result in results.values():
+        assert result['pages'] == pages, result
+
+    return results
+
+
+@benchmark
+def bench_replay(entries=100, fields=5, pages=20):
+    # crawl of site served over HTTP, while it's recorded to archive, and its
+    # replay from archive
+    item_set_class = make_item_set_class(make_item_class(fields))
+    site = generate_site(pages, entries, fields)
+    directory = tempfile.mkdtemp()
+    archive = scrapper.ResponseArchive(os.path.join(directory, 'archive'))
+
+    def crawl(fetcher):
+        def pages_of_site():
+            for page in range(pages):
+                url = '%s/page/%d.html' % (base_url, page)
+                yield sum(
+                    1 for item in item_set_class(url, fetcher=fetcher)
+                    if item.as_dict()
+                )
+
+        return pages_of_site
+
+    try:
+        with serve_site(site) as base_url, scrapper.Fetcher(
+            rate_limiter=scrapper.RateLimiter(rate=0), archive=archive,
+        ) as fetcher:
+            recorded = measure_crawl(crawl(fetcher))
+
+        replayed = measure_crawl(crawl(scrapper.ReplayFetcher(archive)))
+    finally:
+        archive.close()
+        shutil.rmtree(directory)
+
+    return {
+        'recorded': recorded,
+        'replayed': replayed,
+        'speedup': replayed['pages_per_s'] / recorded['pages_per_s'],
+    }
+
+
+def collect_crawl(detached, entries, fields, pages):
+    # collects all items of crawl over locally served site, run in separate
+    # process, so its peak RSS, that includes lxml trees, isn't affected by
+    # other benchmarks
+    item_set_class = make_item_set_class(make_item_class(fields))
+    site = generate_site(pages, entries, fields)
+
+    with serve_site(site) as base_url, scrapper.Fetcher(
+        rate_limiter=scrapper.RateLimiter(rate=0),
+    ) as fetcher:
+        pagination_class = type('BenchPagination', (scrapper.Pagination,), {
+            'url': base_url + '/index.html',
+            'links_selector': '//a[@class="page"]/@href',
+            'item_class': item_set_class,
+            'detached': detached,
+        })
+
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        start = timeit.default_timer()
+        items = [
+            item for item_set in pagination_class(fetcher)
+            for item in item_set
+        ]
+        elapsed = timeit.default_timer() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'items': len(items),
+        'items_per_s': len(items) / elapsed,
+        'python_current_kb': current / 1024,
+        'python_peak_kb': peak / 1024,
+        'rss_growth_kb':
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+    }
+
+
+@benchmark
+def bench_detached(entries=100, fields=5, pages=50):
+    # memory held by items collected from whole crawl, when they keep their
+    # pages and when they are detached
+    results = {}
+    for detached in (False, True):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results['detached' if detached else 'regular'] = executor.submit(
+                collect_crawl, detached, entries, fields, pages,
+            ).result()
+
+    return results
+
+
+class CountingSite(dict):
+    # site that counts requested pages
+    requests = 0
+
+    def get(self, *args):
+        self.requests += 1
+        return super().get(*args)
+
+
+@benchmark
+def bench_incremental(entries=100, fields=5, pages=50, new=10):
+    # recurring crawl of newest-first feed, after ``new`` entries were added,
+    # when whole feed is crawled and when pagination stops at seen entries
+    item_set_class = make_item_set_class(make_item_class(fields))
+    newest = pages * entries
+    site = CountingSite(generate_feed(newest, pages, entries, fields))
+    seen = scrapper.SeenStore()
+    results = {}
+
+    with serve_site(site) as base_url, scrapper.Fetcher(
+        rate_limiter=scrapper.RateLimiter(rate=0),
+    ) as fetcher:
+        pagination_class = type('BenchPagination', (scrapper.Pagination,), {
+            'url': base_url + '/page/0.html',
+            'next_selector': '//a[@class="next"]/@href',
+            'item_class': item_set_class,
+            'seen_field': 'title',
+        })
+
+        def crawl(seen=None):
+            site.requests = records = 0
+            start = timeit.default_timer()
+            try:
+                for item_set in pagination_class(fetcher, seen=seen):
+                    records += sum(1 for item in item_set if item.as_dict())
+            except scrapper.ScrapperCantFindNext:
+                pass
+
+            return {
+                'pages': site.requests,
+                'records': records,
+                'elapsed_s': timeit.default_timer() - start,
+            }
+
+        # first run remembers all entries
+        crawl(seen)
+        site.update(generate_feed(newest + new, pages, entries, fields))
+        results['full'] = crawl()
+        results['incremental'] = crawl(seen)
+
+    assert results['incremental']['records'] == new, results
+    results['speedup'] = \
+        results['full']['elapsed_s'] / results['incremental']['elapsed_s']
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scrapper benchmarks')
+    parser.add_argument(
+        'names', nargs='*', metavar='name',
+        help='benchmarks to run, all by default, one of: %s' % ', '.join(
+            sorted(BENCHMARKS),
+        ),
+    )
+    parser.add_argument('--entries', type=int, default=100)
+    parser.add_argument('--fields', type=int, default=5)
+    parser.add_argument(
+        '--pages', type=int,
+        help='number of pages, for benchmarks that process many of them',
+    )
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+
+    results = {}
+    for name in args.names or sorted(BENCHMARKS):
+        kwargs = {'entries': args.entries, 'fields': args.fields}
+        if args.pages and 'pages' in inspect.signature(
+                BENCHMARKS[name]).parameters:
+            kwargs['pages'] = args.pages
+
+        results[name] = BENCHMARKS[name](**kwargs)
+
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
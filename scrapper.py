@@ -1,12 +1,41 @@
+import asyncio
+import bisect
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
 import copy
+import csv
+import functools
+import hashlib
+import json
+import math
+import mmap
+import os
+import pickle
+import queue
+import random
 import re
-from datetime import datetime
-from time import sleep
-from urllib.parse import urljoin
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep
+from urllib.parse import (
+    parse_qsl, urlencode, urljoin, urlparse, urlsplit, urlunsplit,
+)
 
 import lxml.etree
 import lxml.html
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 ' \
              '(KHTML, like Gecko) Chrome/40.0.2214.111 Safari/537.36'
@@ -15,8 +44,26 @@ HEADERS = {
     'User-Agent': USER_AGENT,
 }
 
+# minimal delay between requests to the same host, used by the default
+# ``RateLimiter``
 FETCH_DATA_DELAY = 0.1
 
+# requests that got responses with these status codes are repeated by the
+# default ``RetryPolicy``, 429 and 503 mean that we are going too fast
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# (connect, read) timeout of requests in seconds, used by the default
+# ``RetryPolicy``
+TIMEOUT = (10.0, 60.0)
+
+# connection pool settings used by the default ``Fetcher``
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
+
+# options of ``lxml.html.HTMLParser`` used to parse pages, like
+# ``remove_blank_text``, ``remove_comments`` or ``huge_tree``
+PARSER_OPTIONS = {}
+
 REGEXP_LINK = re.compile(
     r'^(?:http|ftp)s?://'  # http:// or https://
     r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+'
@@ -28,6 +75,10 @@ REGEXP_LINK = re.compile(
     re.IGNORECASE,
 )
 
+# instance of ``Stats`` collecting timings and counters of crawl, nothing is
+# measured when it's not set
+STATS = None
+
 
 class ScrapperException(Exception):
     pass
@@ -37,30 +88,1080 @@ class ScrapperCantFindNext(ScrapperException):
     pass
 
 
-def fetch_data(url):
-    if not hasattr(fetch_data, 'last_run'):
-        setattr(fetch_data, 'last_run', None)
+class ScrapperCircuitOpen(ScrapperException):
+    pass
+
+
+class ScrapperItemError(ScrapperException):
+    # yielded in place of item that couldn't be created by item sets and
+    # paginations with ``workers``, so other items can still be processed
+    def __init__(self, url, error):
+        super(ScrapperItemError, self).__init__(
+            'Couldn\'t create item for %s: %s' % (url, error)
+        )
+        self.url = url
+        self.error = error
+        self.__cause__ = error
+
+
+class Stats(object):
+    # counters and timings of crawl stages, timings are kept per name and
+    # optional label, i.e. field, as count, sum and max of durations
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = monotonic()
+            self.counters = collections.defaultdict(int)
+            self.timings = collections.OrderedDict()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, duration, label=None):
+        with self._lock:
+            timing = self.timings.get((name, label))
+            if timing is None:
+                self.timings[(name, label)] = [1, duration, duration]
+            else:
+                timing[0] += 1
+                timing[1] += duration
+                timing[2] = max(timing[2], duration)
+
+    def call(self, name, func, *args):
+        # calls ``func`` and records how long it took
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def extract(self, field, label, content, response):
+        # evaluates field, timing its selector and callback separately
+        start = time.perf_counter()
+        value = select_content(
+            field._xpath, content, response, None, field.variables,
+        )
+        end = time.perf_counter()
+        self.observe('field_xpath', end - start, label)
+
+        if field.callback:
+            value = field.callback(value, content, response)
+            self.observe('field_callback', time.perf_counter() - end, label)
+
+        return value
+
+    def items_per_second(self):
+        elapsed = monotonic() - self.started
+        return self.counters['items'] / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        with self._lock:
+            timings = {}
+            for (name, label), (count, total, longest) in self.timings.items():
+                timing = {
+                    'count': count, 'sum': total, 'max': longest,
+                    'mean': total / count,
+                }
+                if label is None:
+                    timings[name] = timing
+                else:
+                    timings.setdefault(name, {})[label] = timing
+
+            result = {
+                'counters': dict(self.counters),
+                'timings': timings,
+                'elapsed': monotonic() - self.started,
+            }
+
+        result['items_per_second'] = self.items_per_second()
+        return result
+
+    def prometheus(self, prefix='scrapper'):
+        # returns stats in Prometheus text exposition format
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+                lines.append('%s_%s_total %s' % (prefix, name, value))
+
+            declared = set()
+            for (name, label), (count, total, _) in self.timings.items():
+                metric = '%s_%s_seconds' % (prefix, name)
+                if metric not in declared:
+                    declared.add(metric)
+                    lines.append('# TYPE %s summary' % metric)
+
+                labels = '' if label is None else '{field="%s"}' % (
+                    label.replace('\\', '\\\\').replace('"', '\\"')
+                )
+                lines.append('%s_count%s %d' % (metric, labels, count))
+                lines.append('%s_sum%s %r' % (metric, labels, total))
+
+        lines.append('# TYPE %s_items_per_second gauge' % prefix)
+        lines.append('%s_items_per_second %r' % (
+            prefix, self.items_per_second(),
+        ))
+        return '\n'.join(lines) + '\n'
+
+
+def get_host(url):
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value):
+    # ``Retry-After`` header holds either number of seconds or HTTP date
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket(object):
+    # allows ``burst`` requests at once and then ``rate`` requests per second,
+    # tokens are reserved up front, so concurrent callers queue up in order
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now, rate=None):
+        rate = self.rate if rate is None else rate
+        if not rate:
+            return max(0.0, self.blocked_until - now)
+
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * rate,
+        )
+        self.updated = now
+        self.tokens -= 1
+
+        delay = -self.tokens / rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - now)
+
+    def block(self, now, delay):
+        self.blocked_until = max(self.blocked_until, now + delay)
+
+
+class RateLimiter(object):
+    # keeps separate ``TokenBucket`` for every host, ``rate`` is number of
+    # requests per second, by default it's computed from ``FETCH_DATA_DELAY``,
+    # ``hosts`` maps host names to theirs own rate or (rate, burst) tuple
+    def __init__(self, rate=None, burst=1, hosts=None):
+        self.rate = rate
+        self.burst = burst
+        self.hosts = {
+            host.lower(): limits if isinstance(limits, tuple) else (limits, 1)
+            for host, limits in (hosts or {}).items()
+        }
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.__class__.__name__, self.rate, self.burst)
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            rate, burst = self.hosts.get(host, (self.rate, self.burst))
+            self._buckets[host] = TokenBucket(rate, burst)
+
+        return self._buckets[host]
+
+    def _default_rate(self):
+        return 1.0 / FETCH_DATA_DELAY if FETCH_DATA_DELAY > 0 else None
+
+    def reserve(self, url):
+        # reserves a request to host of given url, returns for how long
+        # caller has to wait before making it
+        with self._lock:
+            bucket = self._bucket(get_host(url))
+            rate = self._default_rate() if bucket.rate is None else None
+            return bucket.reserve(monotonic(), rate)
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            sleep(delay)
+            if STATS is not None:
+                STATS.observe('rate_limiter_sleep', delay)
+
+        return delay
+
+    async def async_wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+            if STATS is not None:
+                STATS.observe('rate_limiter_sleep', delay)
+
+        return delay
+
+    def backoff(self, url, delay):
+        # stops all requests to the host for given time
+        with self._lock:
+            self._bucket(get_host(url)).block(monotonic(), delay)
+
+
+_default_rate_limiter = None
+
+
+def get_default_rate_limiter():
+    global _default_rate_limiter  # pylint: disable=global-statement
+    if _default_rate_limiter is None:
+        _default_rate_limiter = RateLimiter()
+
+    return _default_rate_limiter
+
+
+class CacheEntry(object):
+    def __init__(self, key, meta, body):
+        self.key = key
+        self.meta = meta
+        self.body = body
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.meta['url'])
+
+    @property
+    def age(self):
+        return time.time() - self.meta['validated']
+
+    def validators(self):
+        # headers for conditional request
+        headers = {}
+        stored_headers = CaseInsensitiveDict(self.meta['headers'])
+        if stored_headers.get('ETag'):
+            headers['If-None-Match'] = stored_headers['ETag']
+        if stored_headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = stored_headers['Last-Modified']
+
+        return headers
+
+    def response(self, not_modified=False):
+        response = requests.Response()
+        response._content = self.body  # pylint: disable=protected-access
+        response.status_code = self.meta['status']
+        response.headers = CaseInsensitiveDict(self.meta['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = self.meta['url']
+        response.from_cache = True
+        # server confirmed that page didn't change since it was stored
+        response.not_modified = not_modified
+        return response
+
+
+class ResponseCache(object):
+    # keeps successful responses in ``path`` directory, keyed by url and
+    # request headers listed in ``vary``, responses younger than
+    # ``fresh_for`` seconds are used without asking server, older ones are
+    # revalidated using ``ETag`` and ``Last-Modified``, responses not
+    # validated for ``ttl`` seconds are dropped, and when cache grows over
+    # ``max_size`` bytes least recently used ones are removed
+    def __init__(self, path, max_size=256 * 1024 * 1024, ttl=None,
+                 fresh_for=0, vary=('Accept', 'Accept-Language')):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fresh_for = fresh_for
+        self.vary = vary
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.path)
+
+    @property
+    def size(self):
+        return self._size
+
+    def counters(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+            'evictions': self.evictions,
+            'size': self._size,
+        }
+
+    def key(self, url, headers=None):
+        key = hashlib.sha1(url.encode('utf-8'))
+        for name in self.vary:
+            value = (headers or {}).get(name)
+            if value:
+                key.update(('\n%s: %s' % (name.lower(), value)).encode())
+
+        return key.hexdigest()
+
+    def _filename(self, key, extension):
+        return os.path.join(self.path, key[:2], '%s.%s' % (key, extension))
+
+    def _entries(self):
+        # yields (key, last use time, size) of all stored entries
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+
+                key = filename[:-len('.json')]
+                try:
+                    meta_stat = os.stat(os.path.join(directory, filename))
+                    body_stat = os.stat(self._filename(key, 'body'))
+                except OSError:
+                    continue
+
+                yield (
+                    key, meta_stat.st_mtime,
+                    meta_stat.st_size + body_stat.st_size,
+                )
+
+    def _file_size(self, filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+    def _write(self, filename, data):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        old_size = self._file_size(filename)
+
+        temporary = '%s.%d.%d.tmp' % (
+            filename, os.getpid(), threading.get_ident(),
+        )
+        with open(temporary, 'wb') as fh:
+            fh.write(data)
+        os.replace(temporary, filename)
+
+        with self._lock:
+            self._size += len(data) - old_size
+
+    def _write_meta(self, key, meta):
+        self._write(
+            self._filename(key, 'json'), json.dumps(meta).encode('utf-8'),
+        )
+
+    def _remove(self, key):
+        for extension in ('json', 'body'):
+            filename = self._filename(key, extension)
+            size = self._file_size(filename)
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+
+            with self._lock:
+                self._size -= size
+
+    def load(self, key):
+        try:
+            with open(self._filename(key, 'json'), 'rb') as fh:
+                meta = json.loads(fh.read().decode('utf-8'))
+            with open(self._filename(key, 'body'), 'rb') as fh:
+                body = fh.read()
+        except (OSError, ValueError):
+            return None
+
+        entry = CacheEntry(key, meta, body)
+        if self.ttl is not None and entry.age > self.ttl:
+            self._remove(key)
+            with self._lock:
+                self.evictions += 1
+            return None
+
+        # modification time of metadata is time of last use
+        os.utime(self._filename(key, 'json'))
+        return entry
+
+    def store(self, key, url, response):
+        body = response.content
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        self._write(self._filename(key, 'body'), body)
+        self._write_meta(key, {
+            'url': url,
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'validated': time.time(),
+        })
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self, size=None):
+        # removes least recently used entries, until cache is smaller than
+        # ``size``, by default 90% of ``max_size``
+        size = int(self.max_size * 0.9) if size is None else size
+        for key, _, _ in sorted(self._entries(), key=lambda entry: entry[1]):
+            if self._size <= size:
+                break
+
+            self._remove(key)
+            with self._lock:
+                self.evictions += 1
+
+    def fetch(self, url, headers, request):
+        # returns response for url, from cache or using ``request`` callable,
+        # that takes additional request headers
+        key = self.key(url, headers)
+        entry = self.load(key)
+
+        if entry is not None and entry.age < self.fresh_for:
+            with self._lock:
+                self.hits += 1
+            return entry.response()
+
+        response = request(entry.validators() if entry is not None else {})
+
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.revalidated += 1
+
+            entry.meta['validated'] = time.time()
+            self._write_meta(key, entry.meta)
+            return entry.response(not_modified=True)
+
+        with self._lock:
+            self.misses += 1
+
+        if response.status_code == 200:
+            self.store(key, url, response)
+
+        return response
+
+
+class ArchivedResponse(requests.Response):
+    # response read from ``ResponseArchive``, ``body`` is a view of mapped
+    # archive, it's copied only when ``content`` is accessed
+    def __init__(self, url, status_code, headers, body):
+        super(ArchivedResponse, self).__init__()
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.encoding = get_encoding_from_headers(self.headers)
+        self.body = body
+        self.from_archive = True
+
+    @property
+    def content(self):
+        if self._content is False:
+            self._content = bytes(self.body)
+
+        return self._content
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        # ``chunk_size`` of None gives whole body at once, empty body gives
+        # nothing
+        size = len(self.body)
+        chunk_size = chunk_size or max(size, 1)
+        for start in range(0, size, chunk_size):
+            yield bytes(self.body[start:start + chunk_size])
+
+    def close(self):
+        pass
+
+
+class ResponseArchive(object):
+    # append-only file with responses, every record holds url, status code,
+    # headers and body, index of records is built when archive is opened,
+    # and the latest record of url is used; bodies are read through mmap
+    header = struct.Struct('!4sIHIQ')
+    magic = b'SCRA'
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+
+        self._lock = threading.Lock()
+        self._map = None
+        self._fh = open(path, 'a+b')
+        self._size = self._scan()
+
+    def __repr__(self):
+        return '%s(%r, responses=%d)' % (
+            self.__class__.__name__, self.path, len(self.index),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _scan(self):
+        # builds index, incomplete record at the end, left by interrupted
+        # write, is cut off, file that isn't an archive, or is corrupted,
+        # is left as it is
+        self._fh.seek(0, os.SEEK_END)
+        size = self._fh.tell()
+        offset = 0
+        while offset < size:
+            self._fh.seek(offset)
+            data = self._fh.read(self.header.size)
+            if not self.magic.startswith(data[:len(self.magic)]):
+                self._fh.close()
+                raise ScrapperException(
+                    '"{}" isn\'t an archive, or it\'s corrupted at {}'.format(
+                        self.path, offset,
+                    )
+                )
+
+            if len(data) < self.header.size:
+                break
+
+            _, url_size, status, headers_size, body_size = \
+                self.header.unpack(data)
+            end = offset + self.header.size + url_size + headers_size + \
+                body_size
+            if end > size:
+                break
+
+            url = self._fh.read(url_size).decode('utf-8')
+            self.index[url] = (offset, status)
+            offset = end
+
+        if offset != size:
+            self._fh.truncate(offset)
+
+        return offset
+
+    def record(self, url, response):
+        url = url.encode('utf-8')
+        headers = getattr(response, 'headers', None)
+        if not isinstance(headers, collections.abc.Mapping):
+            headers = {}
+        headers = json.dumps(dict(headers)).encode('utf-8')
+        body = response.content or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        with self._lock:
+            offset = self._size
+            self._fh.seek(offset)
+            self._fh.write(self.header.pack(
+                self.magic, len(url), response.status_code, len(headers),
+                len(body),
+            ))
+            self._fh.write(url)
+            self._fh.write(headers)
+            self._fh.write(body)
+            self._fh.flush()
+
+            self._size += self.header.size + len(url) + len(headers) + \
+                len(body)
+            self.index[url.decode('utf-8')] = (offset, response.status_code)
+
+    def response(self, url):
+        # returns ``ArchivedResponse``, or None when url wasn't recorded
+        entry = self.index.get(url)
+        if entry is None:
+            return None
+
+        offset, status = entry
+        with self._lock:
+            if self._map is None or len(self._map) < self._size:
+                # archive grew since it was mapped
+                self._map = mmap.mmap(
+                    self._fh.fileno(), self._size, access=mmap.ACCESS_READ,
+                )
+            view = memoryview(self._map)
+
+        _, url_size, _, headers_size, body_size = self.header.unpack_from(
+            view, offset,
+        )
+        start = offset + self.header.size + url_size
+        headers = json.loads(bytes(view[start:start + headers_size]))
+        start += headers_size
+
+        return ArchivedResponse(
+            url, status, headers, view[start:start + body_size],
+        )
+
+    def close(self):
+        # responses that are still used keep mapped archive open
+        self._map = None
+        self._fh.close()
+
+
+class RetryPolicy(object):
+    # requests that timed out, failed to connect or got response with one of
+    # ``statuses`` are repeated up to ``retries`` times, after waiting as long
+    # as ``Retry-After`` header says, or with exponential backoff starting at
+    # ``backoff`` seconds, up to ``max_backoff``, increased randomly by up to
+    # ``jitter`` part of it, so clients don't retry all at once
+    def __init__(self, retries=3, backoff=1.0, max_backoff=60.0, jitter=0.5,
+                 statuses=None, timeout=None,
+                 exceptions=(requests.ConnectionError, requests.Timeout)):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = RETRY_STATUS_CODES if statuses is None else statuses
+        # (connect, read) timeout or single number for both of them
+        self.timeout = TIMEOUT if timeout is None else timeout
+        self.exceptions = exceptions
+
+    def __repr__(self):
+        return '%s(retries=%d, backoff=%r, timeout=%r)' % (
+            self.__class__.__name__, self.retries, self.backoff, self.timeout,
+        )
+
+    def should_retry(self, attempt, response=None, error=None):
+        if attempt >= self.retries:
+            return False
+
+        if error is not None:
+            return isinstance(error, self.exceptions)
+
+        return response.status_code in self.statuses
+
+    def delay(self, attempt, response=None):
+        delay = None
+        if response is not None:
+            delay = parse_retry_after(
+                getattr(response, 'headers', {}).get('Retry-After'),
+            )
+        if delay is not None:
+            return delay
+
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay + random.uniform(0, self.jitter * delay)
+
+
+class CircuitBreaker(object):
+    # stops requests to host after ``threshold`` consecutive failures, that
+    # is errors and 5xx responses, for ``reset_timeout`` seconds, after that
+    # single request is let through, and when it succeeds host is closed again
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
 
-    if fetch_data.last_run is not None:
-        delta = datetime.now() - fetch_data.last_run
-        delta = delta.seconds + delta.microseconds/1000000.0
-        if delta < FETCH_DATA_DELAY:
-            sleep_for = max(0, FETCH_DATA_DELAY - delta)
-            sleep(sleep_for)
+        # host -> [consecutive failures, time when it was opened]
+        self._hosts = {}
+        self._lock = threading.Lock()
 
-    response = requests.get(url, headers=HEADERS)
+    def __repr__(self):
+        return '%s(threshold=%d, reset_timeout=%r)' % (
+            self.__class__.__name__, self.threshold, self.reset_timeout,
+        )
 
-    if response.status_code != 200:
-        raise ScrapperException(
-            'Request failed, status code: %d' % response.status_code
+    def state(self, url):
+        with self._lock:
+            return self._state(get_host(url), monotonic())
+
+    def _state(self, host, now):
+        failures, opened = self._hosts.get(host, (0, None))
+        if opened is None:
+            return 'closed'
+
+        return 'open' if now - opened < self.reset_timeout else 'half-open'
+
+    def allow(self, url):
+        # tells if request to url can be made, in half-open state only one
+        # request is let through, until it's recorded
+        host = get_host(url)
+        with self._lock:
+            now = monotonic()
+            state = self._state(host, now)
+            if state == 'half-open':
+                # next requests wait for result of this one
+                self._hosts[host][1] = now
+
+            return state != 'open'
+
+    def record(self, url, failed):
+        host = get_host(url)
+        with self._lock:
+            if not failed:
+                self._hosts.pop(host, None)
+                return
+
+            entry = self._hosts.setdefault(host, [0, None])
+            entry[0] += 1
+            if entry[0] >= self.threshold:
+                entry[1] = monotonic()
+
+
+class Fetcher(object):
+    # performs requests using single ``requests.Session``, so connections are
+    # pooled and kept alive between pages fetched from the same host,
+    # requests are throttled by ``rate_limiter``, the default one is shared,
+    # failed ones are repeated according to ``retry_policy``, and when
+    # ``circuit_breaker`` is set, hosts that keep failing aren't requested
+    def __init__(self, headers=None, pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE, session=None, rate_limiter=None,
+                 retry_policy=None, circuit_breaker=None, cache=None,
+                 archive=None):
+        self.headers = HEADERS if headers is None else headers
+        self.session = requests.Session() if session is None else session
+        self.rate_limiter = rate_limiter or get_default_rate_limiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+
+        # instance of ``ResponseCache``, responses aren't cached by default
+        self.cache = cache
+
+        # instance of ``ResponseArchive`` where all fetched responses are
+        # recorded, except streamed ones, they can be replayed by
+        # ``ReplayFetcher``
+        self.archive = archive
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
         )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.session)
+
+    def __deepcopy__(self, memo):
+        # fetcher holds connections and limits shared by many items
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get(self, url, headers=None, stream=False):
+        if headers:
+            headers = dict(self.headers, **headers)
+
+        kwargs = {
+            'headers': headers or self.headers,
+            'timeout': self.retry_policy.timeout,
+        }
+        if stream:
+            kwargs['stream'] = True
+
+        return self.session.get(url, **kwargs)
+
+    def fetch(self, url, throttle=True, stream=False):
+        # with ``stream`` set body isn't downloaded until it's read, unless
+        # response goes to ``cache``
+        if self.cache is None:
+            response = self.request(url, throttle, stream=stream)
+        else:
+            response = self.cache.fetch(
+                url, self.headers,
+                functools.partial(self.request, url, throttle),
+            )
+
+        if self.archive is not None and not stream:
+            self.archive.record(url, response)
+
+        if response.status_code != 200:
+            raise ScrapperException(
+                'Request failed, status code: %d' % response.status_code
+            )
+
+        return response
+
+    def request(self, url, throttle=True, headers=None, stream=False):
+        # ``throttle`` can be disabled when caller already waited for
+        # ``rate_limiter``, repeated requests are always throttled, and other
+        # requests to the same host wait before repeated one too
+        policy = self.retry_policy
+        breaker = self.circuit_breaker
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow(url):
+                raise ScrapperCircuitOpen(
+                    'Requests to %s are stopped after too many failures' % (
+                        get_host(url),
+                    )
+                )
+
+            if throttle or attempt:
+                self.rate_limiter.wait(url)
+
+            response = error = None
+            try:
+                response = self._get(url, headers, stream)
+            except policy.exceptions as exc:
+                error = exc
+
+            if breaker is not None:
+                breaker.record(
+                    url, error is not None or response.status_code >= 500,
+                )
+
+            if not policy.should_retry(attempt, response, error):
+                break
+
+            if STATS is not None:
+                STATS.count('retries')
+
+            delay = policy.delay(attempt, response)
+            if response is not None and hasattr(response, 'close'):
+                # streamed response holds pooled connection until it's closed
+                response.close()
+
+            self.rate_limiter.backoff(url, delay)
+            attempt += 1
+
+        if error is not None:
+            raise ScrapperException(
+                'Request failed: %s' % error
+            ) from error
+
+        return response
+
+    def _get(self, url, headers, stream):
+        stats = STATS
+        if stats is None:
+            return self.get(url, headers, stream)
+
+        response = stats.call('fetch', self.get, url, headers, stream)
+        stats.count('requests')
+        if not stream:
+            stats.count('bytes', len(
+                getattr(response, 'content', None) or b'',
+            ))
+
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+class ReplayFetcher(Fetcher):
+    # serves responses recorded in ``archive``, instead of fetching them,
+    # requests aren't throttled nor repeated
+    def __init__(self, archive, **kwargs):
+        kwargs.setdefault('rate_limiter', RateLimiter(rate=0))
+        kwargs.setdefault('retry_policy', RetryPolicy(retries=0))
+        super(ReplayFetcher, self).__init__(**kwargs)
+        self.source = archive
+
+    def get(self, url, headers=None, stream=False):
+        response = self.source.response(url)
+        if response is None:
+            raise ScrapperException('%s is not in archive' % url)
+
+        return response
+
+
+_default_fetcher = None
+
+
+def get_default_fetcher():
+    global _default_fetcher  # pylint: disable=global-statement
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+
+    return _default_fetcher
 
-    fetch_data.last_run = datetime.now()
-    return response
 
+def resolve_fetcher(fetcher=None, *fallbacks):
+    for candidate in (fetcher,) + fallbacks:
+        if candidate is not None:
+            return candidate
 
-def select_content(selector, content, response, callback=None):
-    value = content.xpath(selector)
+    return get_default_fetcher()
+
+
+def fetch_data(url, fetcher=None, throttle=True):
+    return resolve_fetcher(fetcher).fetch(url, throttle)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_cached(selector):
+    return lxml.etree.XPath(selector)
+
+
+def compile_selector(selector, namespaces=None):
+    if isinstance(selector, lxml.etree.XPath):
+        return selector
+
+    if namespaces:
+        return lxml.etree.XPath(selector, namespaces=namespaces)
+
+    return _compile_cached(selector)
+
+
+def read_ahead(iterable, depth=1):
+    # iterates over ``iterable`` in background thread, at most ``depth``
+    # values ahead of the consumer, exceptions are raised in consumer thread
+    values = queue.Queue()
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        iterator = iter(iterable)
+        while True:
+            slots.acquire()
+            if stop.is_set():
+                return
+
+            try:
+                values.put((next(iterator, end), None))
+            except BaseException as exc:  # pylint: disable=broad-except
+                values.put((end, exc))
+                return
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            value, error = values.get()
+            if error is not None:
+                raise error
+            if value is end:
+                return
+
+            slots.release()
+            yield value
+    finally:
+        stop.set()
+        slots.release()
+
+
+def fan_out(func, calls, workers, ordered=True):
+    # calls ``func(url, *args)`` for every (url, *args) tuple of ``calls`` in
+    # pool of ``workers`` threads, at most twice as many calls are pending at
+    # once, yields (url, result) in order of ``calls`` or as they complete,
+    # exceptions of ``func`` are yielded as ``ScrapperItemError``, and ones
+    # of ``calls`` are raised when pending calls are done
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = collections.OrderedDict()
+    error = None
+
+    def results(block):
+        while pending and (block or len(pending) >= 2 * workers):
+            if ordered:
+                done = [next(iter(pending))]
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    yield url, future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    if STATS is not None:
+                        STATS.count('errors')
+                    yield url, ScrapperItemError(url, exc)
+
+    try:
+        calls = iter(calls)
+        while True:
+            try:
+                call = next(calls)
+            except StopIteration:
+                break
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+                break
+
+            pending[executor.submit(func, *call)] = call[0]
+            for result in results(False):
+                yield result
+
+        for result in results(True):
+            yield result
+
+        if error is not None:
+            raise error
+    finally:
+        # consumer stopped iterating, calls that didn't start aren't needed
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class AsyncFetcher(object):
+    # asyncio interface to ``Fetcher``, requests are run in a thread pool,
+    # at most ``concurrency`` at once and at most ``per_host`` to single host
+    def __init__(self, fetcher=None, concurrency=32, per_host=None):
+        self.fetcher = resolve_fetcher(fetcher)
+        self.concurrency = concurrency
+        self.per_host = per_host
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+        self._hosts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _host_semaphore(self, url):
+        host = get_host(url)
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+
+        return self._hosts[host]
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args),
+        )
+
+    async def fetch(self, url):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphore:
+            if not self.per_host:
+                return await self._fetch(url)
+
+            async with self._host_semaphore(url):
+                return await self._fetch(url)
+
+    async def _fetch(self, url):
+        # waiting for rate limiter doesn't occupy a thread
+        await self.fetcher.rate_limiter.async_wait(url)
+        return await self.run(fetch_data, url, self.fetcher, False)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def select_content(selector, content, response, callback=None,
+                   variables=None):
+    value = compile_selector(selector)(content, **(variables or {}))
     if isinstance(value, list):
         value = value[0] if len(value) else None
 
@@ -70,14 +1171,166 @@ def select_content(selector, content, response, callback=None):
     return value
 
 
+_parsers = threading.local()
+
+
+def get_parser(encoding=None):
+    # parsers are reused by every thread, one for every encoding and
+    # ``PARSER_OPTIONS``, since creating them isn't free
+    options = tuple(sorted(PARSER_OPTIONS.items()))
+    parsers = getattr(_parsers, 'parsers', None)
+    if parsers is None:
+        parsers = _parsers.parsers = {}
+
+    parser = parsers.get((encoding, options))
+    if parser is None:
+        parser = parsers[(encoding, options)] = lxml.html.HTMLParser(
+            encoding=encoding, **PARSER_OPTIONS
+        )
+
+    return parser
+
+
+def response_encoding(response):
+    # encoding declared in ``Content-Type`` header of response, ``requests``
+    # assumes ISO-8859-1 when there is no charset, but then page itself should
+    # be trusted
+    headers = getattr(response, 'headers', None)
+    if not isinstance(headers, collections.abc.Mapping):
+        return None
+
+    if not isinstance(headers, CaseInsensitiveDict):
+        headers = CaseInsensitiveDict(headers)
+
+    content_type = headers.get('content-type')
+    return _content_type_encoding(content_type) if content_type else None
+
+
+@functools.lru_cache(maxsize=64)
+def _content_type_encoding(content_type):
+    if 'charset' not in content_type.lower():
+        return None
+
+    encoding = get_encoding_from_headers({'content-type': content_type})
+    if not encoding:
+        return None
+
+    # charset is passed to libxml2 as it's given, it doesn't know names of
+    # Python codecs, like ``euc_jp``, unknown ones are detected by parser
+    try:
+        lxml.etree.HTMLParser(encoding=encoding)
+    except LookupError:
+        return None
+
+    return encoding
+
+
+def parse_content(content, response=None):
+    # already parsed elements are used as they are, bytes are decoded using
+    # encoding from headers of ``response``
+    if lxml.etree.iselement(content):
+        return content
+
+    encoding = None
+    if isinstance(content, bytes):
+        encoding = response_encoding(response)
+    parser = get_parser(encoding)
+
+    if STATS is not None:
+        return STATS.call('parse', lxml.html.fromstring, content, None, parser)
+
+    return lxml.html.fromstring(content, parser=parser)
+
+
+def is_parsed(element):
+    # tells if parser already went past the end of element, it's safe to
+    # move it out of the tree then
+    while element is not None:
+        if element.getnext() is not None:
+            return True
+        element = element.getparent()
+
+    return False
+
+
+def detach_element(element):
+    # moves element out of its tree into a new, lightweight document, so it
+    # can be processed without serializing and parsing it again, ``//`` in
+    # selectors refers then only to this element, as if it was parsed alone
+    root = lxml.html.Element('html')
+    lxml.etree.SubElement(root, 'body').append(element)
+    return element
+
+
+class ScrapperMeta(type):
+    # compiles XPath selectors listed in ``_selectors`` once, when class is
+    # created, using ``namespaces`` defined on class, and collects fields,
+    # including inherited ones
+    def __init__(cls, name, bases, attrs):
+        super(ScrapperMeta, cls).__init__(name, bases, attrs)
+
+        cls._xpaths = {}
+        for attr in getattr(cls, '_selectors', ()):
+            selector = getattr(cls, attr, None)
+            if selector:
+                cls._xpaths[attr] = compile_selector(selector, cls.namespaces)
+
+        fields = collections.OrderedDict()
+        for klass in reversed(cls.__mro__):
+            for attr_name, value in vars(klass).items():
+                if isinstance(value, Field):
+                    fields[attr_name] = value
+                elif attr_name in fields:
+                    del fields[attr_name]
+
+        for attr_name, field in fields.items():
+            if field.name is None:
+                field.name = attr_name
+            elif field.name != attr_name:
+                # the same field is used under different name
+                fields[attr_name] = copy.copy(field)
+                fields[attr_name].name = attr_name
+                setattr(cls, attr_name, fields[attr_name])
+
+        cls._base_fields = fields
+        cls._field_names = tuple(fields)
+        cls._field_index = {
+            attr_name: index for index, attr_name in enumerate(fields)
+        }
+        cls._plan = ExtractionPlan(fields) if len(fields) > 1 else None
+
+
+def get_xpath(obj, attr):
+    # returns selector compiled by ``ScrapperMeta``, recompiles it when it was
+    # overridden after class creation, i.e. on instance
+    selector = getattr(obj, attr)
+    xpath = obj._xpaths.get(attr)
+    if xpath is None or xpath.path != selector:
+        xpath = compile_selector(selector, obj.namespaces)
+
+    return xpath
+
+
+# marks values of fields that weren't evaluated yet
+_PENDING = object()
+
+
 class Field(object):
-    def __init__(self, selector='', callback=None):
+    def __init__(self, selector='', callback=None, namespaces=None,
+                 variables=None):
         if not selector:
             raise ValueError('You have to specify `selector`')
 
         self.selector = selector
         self.callback = callback
+        self.namespaces = namespaces
+        self.variables = variables
 
+        # attribute name, set when ``Item`` subclass is created
+        self.name = None
+
+        self._xpath = compile_selector(selector, namespaces)
+        # value of field used on its own, items keep values by themselves
         self._value = None
 
     def __repr__(self):
@@ -87,69 +1340,421 @@ class Field(object):
             self.callback,
         )
 
+    def __deepcopy__(self, memo):
+        # compiled selector can't be copied, and there is no need to
+        field = copy.copy(self)
+        field._value = copy.deepcopy(self._value, memo)
+        return field
+
     def __get__(self, instance, owner=None):
-        return self._value
+        if instance is None:
+            return self._value
+
+        index = instance._field_index[self.name]
+        value = instance._values[index]
+        if value is _PENDING:
+            instance.evaluate(self.name)
+            value = instance._values[index]
+
+        return value
 
     def __set__(self, instance, value):
-        self._value = value
+        if instance is None:
+            self._value = value
+        else:
+            instance._values[instance._field_index[self.name]] = value
 
-    def process(self, content, response):
-        self._value = select_content(
-            self.selector, content, response, self.callback,
+    def extract(self, content, response):
+        return select_content(
+            self._xpath, content, response, self.callback, self.variables,
         )
 
+    def process(self, content, response):
+        self._value = self.extract(content, response)
+
+
+# axes that don't leave subtree of context node
+_DOWNWARD_AXES = (
+    'child', 'descendant', 'descendant-or-self', 'self', 'attribute',
+)
+
 
-class Item(object):
-    def __new__(cls, *_, **__):
-        cls._base_fields = {}
+def split_path(selector):
+    # splits absolute location path into (separator, step) pairs, returns
+    # None for other expressions, like unions or function calls
+    if not selector.startswith('/'):
+        return None
+
+    steps = []
+    index, length = 0, len(selector)
+    while index < length:
+        separator = '//' if selector.startswith('//', index) else '/'
+        if selector[index] != '/':
+            return None
+        index += len(separator)
+
+        start, depth, quote = index, 0, None
+        while index < length:
+            char = selector[index]
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char in '[(':
+                depth += 1
+            elif char in '])':
+                depth -= 1
+            elif depth == 0 and char == '/':
+                break
+            elif depth == 0 and (char == '|' or char.isspace()):
+                return None
+            index += 1
+
+        if index == start or depth or quote:
+            return None
+        steps.append((separator, selector[start:index]))
+
+    return steps
+
+
+def is_downward(step):
+    # tells if step selects only nodes inside of context node
+    axis = step.split('[', 1)[0]
+    if axis in ('.', '..'):
+        return axis == '.'
+    if '::' in axis:
+        return axis.split('::', 1)[0] in _DOWNWARD_AXES
+
+    return True
+
+
+class ExtractionPlan(object):
+    # fields whose selectors start with the same path, like
+    # ``//div[@class="entry"]/h2/text()`` and ``//div[@class="entry"]/p``, are
+    # evaluated together: context nodes are found once and rest of selectors
+    # are evaluated from each of them, the first value found is the one that
+    # whole selector would return, since contexts are in document order; when
+    # contexts nest, or aren't elements, fields are evaluated one by one
+    def __init__(self, fields):
+        groups = collections.OrderedDict()
+        for name, field in fields.items():
+            steps = None
+            if isinstance(field.selector, str) and not field.variables:
+                steps = split_path(field.selector)
+            if not steps or len(steps) < 2:
+                continue
+
+            namespaces = tuple(sorted((field.namespaces or {}).items()))
+            groups.setdefault((steps[0], namespaces), []).append(
+                (name, steps),
+            )
 
-        for attr_name, field in cls.__dict__.items():
-            if isinstance(field, Field):
-                cls._base_fields[attr_name] = field
+        # (prefix, compiled prefix, [(name, compiled relative path)])
+        self.groups = []
+        for (_, namespaces), members in groups.items():
+            if len(members) < 2:
+                continue
+
+            size = 0
+            shortest = min(len(steps) for _, steps in members)
+            while size < shortest - 1 and all(
+                    steps[size] == members[0][1][size]
+                    for _, steps in members):
+                size += 1
+
+            if not all(
+                    is_downward(step)
+                    for _, steps in members for _, step in steps[size:]):
+                continue
+
+            prefix = ''.join(
+                separator + step for separator, step in members[0][1][:size]
+            )
+            namespaces = dict(namespaces) or None
+            self.groups.append((
+                prefix,
+                compile_selector(prefix, namespaces),
+                [
+                    (name, compile_selector('.' + ''.join(
+                        separator + step for separator, step in steps[size:]
+                    ), namespaces))
+                    for name, steps in members
+                ],
+            ))
+
+        self.names = frozenset(
+            name for _, _, members in self.groups for name, _ in members
+        )
 
-        return super(Item, cls).__new__(cls)
+    def __repr__(self):
+        return '%s(%r)' % (
+            self.__class__.__name__, [prefix for prefix, _, _ in self.groups],
+        )
 
-    def __init__(self, url, caller=None, content=None):
+    def evaluate(self, content, names):
+        # returns values of given fields, before callbacks, only for fields
+        # that could be evaluated together
+        values = {}
+        for _, prefix, members in self.groups:
+            members = [
+                (name, xpath) for name, xpath in members if name in names
+            ]
+            if len(members) < 2:
+                continue
+
+            contexts = prefix(content)
+            if not isinstance(contexts, list) or not all(
+                    lxml.etree.iselement(context) for context in contexts):
+                continue
+
+            found = set(contexts)
+            if any(ancestor in found
+                   for context in contexts
+                   for ancestor in context.iterancestors()):
+                continue
+
+            for name, xpath in members:
+                values[name] = None
+                for context in contexts:
+                    value = xpath(context)
+                    if value:
+                        values[name] = value[0]
+                        break
+
+        return values
+
+
+class Item(object, metaclass=ScrapperMeta):
+    # values of fields are kept in ``_values`` list, in order of
+    # ``_field_names``, fields themselves are shared by all instances
+    __slots__ = (
+        '_caller', '_url', '_fetcher', '_response', '_content', '_values',
+        '_names',
+    )
+
+    # instance of ``Fetcher`` used to download pages, when not set the one
+    # from caller or the default, shared one is used
+    fetcher = None
+
+    # when set, fields are evaluated on first access instead of on creation
+    lazy = False
+
+    # instance of ``FingerprintStore``, when set and fetched page didn't
+    # change since previous run, values of fields are taken from it instead
+    # of parsing the page, by default the one from caller is used
+    fingerprints = None
+
+    # when set, or set on caller, item keeps only values of its fields, page,
+    # its parsed tree and caller are released right after fields are
+    # evaluated, so they are never evaluated lazily
+    detached = False
+
+    def __init__(self, url, caller=None, content=None, fetcher=None,
+                 response=None, fields=None, lazy=None):
         self._caller = caller
         self._url = url
-        self.__dict__.update(copy.deepcopy(self._base_fields))
+        self._fetcher = resolve_fetcher(
+            fetcher, self.fetcher, getattr(caller, 'fetcher', None),
+        )
 
+        # only given ``fields`` are extracted, all of them by default
+        self._names = self._select_fields(fields)
+        if fields is None:
+            self._values = [_PENDING] * len(self._names)
+        else:
+            self._values = [None] * len(self._field_names)
+            for name in self._names:
+                self._values[self._field_index[name]] = _PENDING
+
+        if STATS is not None:
+            STATS.count('items')
+
+        fingerprints = digest = None
         if content is None:
-            self._response = fetch_data(self._url)
-            self._content = lxml.html.fromstring(self._response.content)
+            if response is None:
+                response = fetch_data(self._url, self._fetcher)
+            self._response = response
+
+            fingerprints = resolve_fingerprints(self, caller)
+            if fingerprints is not None:
+                key = fingerprints.key(self, url)
+                digest, records = fingerprints.lookup(key, response.content)
+                if records and all(name in records[0] for name in self._names):
+                    # page didn't change, it doesn't need to be parsed
+                    self._content = None
+                    for name in self._names:
+                        self._values[self._field_index[name]] = \
+                            records[0][name]
+                    if self.detached or getattr(caller, 'detached', False):
+                        self.release()
+                    return
+
+            self._content = parse_content(
+                self._response.content, self._response,
+            )
         else:
             self._response = None
-            self._content = lxml.html.fromstring(content)
+            self._content = parse_content(content)
+
+        if fingerprints is not None:
+            fingerprints.store(key, digest, [self.as_dict()])
+        elif not (self.lazy if lazy is None else lazy):
+            self.evaluate()
+
+        if self.detached or getattr(caller, 'detached', False):
+            self.release()
+
+    def release(self):
+        # evaluates all fields and drops everything else, but values, strings
+        # selected by XPath keep reference to their element, and whole tree
+        # with it, so they are turned into plain ones
+        self.evaluate()
+        self._caller = self._response = self._content = None
+        self._values = [
+            # pylint: disable=protected-access
+            str(value) if isinstance(value, lxml.etree._ElementUnicodeResult)
+            else value
+            for value in self._values
+        ]
+
+    @classmethod
+    def _select_fields(cls, fields=None):
+        if fields is None:
+            return cls._field_names
+
+        unknown = set(fields) - set(cls._field_names)
+        if unknown:
+            raise ScrapperException(
+                'Unknown fields: %s' % ', '.join(sorted(unknown))
+            )
 
-        for _, field in self.__dict__.items():
-            if isinstance(field, Field):
-                field.process(self._content, self._response)
+        return tuple(fields)
+
+    @classmethod
+    def extract_many(cls, documents, fields=None, columns=False):
+        # extracts records from (url, content) pairs without creating items,
+        # returns list of records in order of documents, or dict mapping
+        # names of fields to lists of their values when ``columns`` is set
+        names = cls._select_fields(fields)
+        values = [[] for _ in names]
+        count = 0
+
+        for _, content in documents:
+            count += 1
+            if STATS is not None:
+                STATS.count('items')
+
+            for value, column in zip(
+                    cls._extract(names, parse_content(content)), values):
+                column.append(value)
+
+        if columns:
+            return dict(zip(names, values))
+
+        if not names:
+            return [{} for _ in range(count)]
+
+        return [dict(zip(names, record)) for record in zip(*values)]
+
+    @classmethod
+    def _extract(cls, names, content, response=None):
+        # returns values of given fields of parsed content, fields with common
+        # selectors' prefix are evaluated together, unless ``STATS`` measure
+        # every field
+        stats = STATS
+        planned = {}
+        if stats is None and cls._plan is not None:
+            grouped = [name for name in names if name in cls._plan.names]
+            if len(grouped) > 1:
+                planned = cls._plan.evaluate(content, grouped)
+
+        values = []
+        for name in names:
+            field = cls._base_fields[name]
+            if name in planned:
+                value = planned[name]
+                if field.callback:
+                    value = field.callback(value, content, response)
+            elif stats is None:
+                value = field.extract(content, response)
+            else:
+                value = stats.extract(
+                    field, '%s.%s' % (cls.__name__, name), content, response,
+                )
+            values.append(value)
 
-    def __getattribute__(self, name):
-        if not name.startswith('_') and name in self.__dict__:
-            return self.__dict__[name].__get__(self)
+        return values
 
-        return super(Item, self).__getattribute__(name)
+    def evaluate(self, *names):
+        # evaluates given fields, or all that weren't evaluated yet
+        values = self._values
+        pending = [
+            name for name in names or self._names
+            if values[self._field_index[name]] is _PENDING
+        ]
+        for name, value in zip(pending, self._extract(
+                pending, self._content, self._response)):
+            values[self._field_index[name]] = value
 
     def as_dict(self):
-        return {
-            name: getattr(self, name)
-            for name, field
-            in self.__dict__.items()
-            if isinstance(field, Field)
-        }
+        self.evaluate()
+        return {name: getattr(self, name) for name in self._names}
 
 
-class ItemSet(object):
+class ItemSet(object, metaclass=ScrapperMeta):
+    _selectors = ('content_selector',)
+
     # iterates over items fetched by this selection in BS
     content_selector = None
 
+    # namespaces prefixes used in selectors
+    namespaces = None
+
+    # XPath variables passed when evaluating selectors
+    variables = None
+
     # should be instance of Item
     item_class = None
 
-    def __init__(self, url, caller=None, content=None):
+    # instance of ``Fetcher``, see ``Item.fetcher``
+    fetcher = None
+
+    # when set, page is parsed incrementally, while it's downloaded, and
+    # items are yielded as soon as their elements are parsed, such item set
+    # can be iterated only once, and ``content_selector`` can't depend on
+    # position of elements or on elements before them
+    streaming = False
+
+    # size of chunks in which page is parsed when ``streaming`` is set
+    chunk_size = 64 * 1024
+
+    # instance of ``FingerprintStore``, see ``Item.fingerprints``, records of
+    # items are stored, pages that didn't change aren't parsed again, unless
+    # ``content_selector`` selects links, then only linked pages are
+    # fingerprinted
+    fingerprints = None
+
+    # when ``content_selector`` selects links, i.e. ``//a/@href``, items are
+    # created from pages they point to, with ``workers`` set these pages are
+    # fetched in pool of threads, in order of links or, when ``ordered``
+    # isn't set, as they are fetched, and items that couldn't be created are
+    # yielded as ``ScrapperItemError``
+    workers = 0
+    ordered = True
+
+    # when set, or set on caller, page is released as soon as it's parsed,
+    # so item set can be iterated only once, and created items are detached
+    # too, see ``Item.detached``
+    detached = False
+
+    def __init__(self, url, caller=None, content=None, fetcher=None,
+                 response=None):
         self.url = url
         self.caller = caller
+        self.fetcher = resolve_fetcher(
+            fetcher, self.fetcher, getattr(caller, 'fetcher', None),
+        )
 
         if not self.item_class:
             raise ScrapperException('You need to setup `item_class`')
@@ -161,21 +1766,607 @@ class ItemSet(object):
         if not self.content_selector:
             raise ScrapperException('You need to define `content_selector`')
 
-        if content is None:
-            self.response = fetch_data(self.url)
+        if content is None and response is None and self.streaming:
+            # body is read while items are iterated
+            self.response = self.fetcher.fetch(self.url, stream=True)
+            self.content = None
+        elif content is None:
+            if response is None:
+                response = fetch_data(self.url, self.fetcher)
+
+            self.response = response
             self.content = self.response.content
         else:
             self.response = None
             self.content = content
 
+        self.detached = self.detached or getattr(caller, 'detached', False)
+
+        # items that were already created, i.e. new ones kept by incremental
+        # pagination, they are yielded instead of items of the page
+        self.created = None
+
+        # fetched pages are looked up in fingerprints, records are kept for
+        # unchanged ones
+        self.fingerprints = resolve_fingerprints(self, caller)
+        self._fingerprint = self._records = None
+        # records of items created from selected links depend on pages they
+        # point to, they are fingerprinted by items, not by this page
+        self._follows_links = False
+        if self.fingerprints is not None and self.content is not None and \
+                self.response is not None:
+            self._fingerprint, self._records = self.fingerprints.lookup(
+                self.fingerprints.key(self, self.url), self.content,
+            )
+
     def __iter__(self):
-        parsed = lxml.html.fromstring(self.content)
-        for content in parsed.xpath(self.content_selector):
-            # pylint: disable=not-callable
-            yield self.item_class(self.url, self, lxml.etree.tostring(content))
+        if self.created is not None:
+            for item in self.created:
+                yield item
+            return
+
+        if self.streaming:
+            for content in self.iter_streaming():
+                # pylint: disable=not-callable
+                yield self.item_class(self.url, self, content)
+            return
+
+        if self._records is not None:
+            if self.fingerprints.emit == 'cached':
+                for record in self._records:
+                    yield record
+            return
+
+        if self._fingerprint is None:
+            for item in self._iter_items():
+                yield item
+            return
+
+        records = []
+        failed = False
+        for item in self._iter_items():
+            yield item
+            failed = failed or isinstance(item, ScrapperItemError)
+            records.extend(iter_records(item))
+
+        if not failed and not self._follows_links:
+            self.fingerprints.store(
+                self.fingerprints.key(self, self.url), self._fingerprint,
+                records,
+            )
+
+    def _children(self):
+        # yields (url, content) of items, content is None for selected links
+        if self.content is None:
+            raise ScrapperException('Detached item set was already iterated')
+
+        parsed = parse_content(self.content, self.response)
+        if self.detached:
+            self.content = self.response = None
+        elif parsed is self.content:
+            # items are moved out of the tree, keep given one intact
+            parsed = copy.deepcopy(parsed)
+
+        document = parsed.getroottree().getroot()
+        xpath = get_xpath(self, 'content_selector')
+        for content in xpath(parsed, **(self.variables or {})):
+            if isinstance(content, str):
+                self._follows_links = True
+                yield urljoin(self.url, content), None
+                continue
+
+            if content.getroottree().getroot() is not document:
+                # element is nested in one that was already handed to an item
+                content = copy.deepcopy(content)
+
+            yield self.url, detach_element(content)
+
+    def create_item(self, url, content=None):
+        # pylint: disable=not-callable
+        return self.item_class(url, self, content)
+
+    def _iter_items(self):
+        if not self.workers:
+            for url, content in self._children():
+                yield self.create_item(url, content)
+            return
+
+        for _, item in fan_out(
+                self.create_item, self._children(), self.workers,
+                self.ordered):
+            yield item
+
+    def _chunks(self):
+        if self.content is None:
+            if getattr(self.response, '_content_consumed', False):
+                raise ScrapperException('Streamed page was already iterated')
+
+            try:
+                for chunk in self.response.iter_content(self.chunk_size):
+                    if STATS is not None:
+                        STATS.count('bytes', len(chunk))
+                    yield chunk
+            finally:
+                self.response.close()
+            return
+
+        content = self.content
+        if lxml.etree.iselement(content):
+            content = lxml.etree.tostring(content)
+
+        for start in range(0, len(content), self.chunk_size):
+            yield content[start:start + self.chunk_size]
+
+    def iter_streaming(self):
+        # yields elements selected by ``content_selector``, moved out of the
+        # tree, as soon as they are parsed
+        encoding = None
+        if self.content is None:
+            encoding = response_encoding(self.response)
+
+        parser = lxml.etree.HTMLPullParser(
+            events=('start',), encoding=encoding, **PARSER_OPTIONS
+        )
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        xpath = get_xpath(self, 'content_selector')
+        variables = self.variables or {}
+        root = None
+
+        chunks = self._chunks()
+        while True:
+            chunk = next(chunks, None)
+            if chunk is None:
+                root = parser.close()
+            elif STATS is None:
+                parser.feed(chunk)
+            else:
+                STATS.call('parse', parser.feed, chunk)
+
+            for _, element in parser.read_events():
+                if root is None:
+                    root = element.getroottree().getroot()
+
+            if root is not None:
+                for element in xpath(root, **variables):
+                    if element.getroottree().getroot() is not root:
+                        # nested in element that was already yielded
+                        element = copy.deepcopy(element)
+                    elif chunk is not None and not is_parsed(element):
+                        # keep order of elements, and elements nested in
+                        # this one, until it's parsed
+                        break
+
+                    yield detach_element(element)
+
+            if chunk is None:
+                return
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+
+
+def normalize_url(url):
+    # returns canonical form of url, used to tell if it was already visited:
+    # lowercase scheme and host, no default port, no fragment, sorted query
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+
+    netloc = host
+    if parts.username or parts.password:
+        netloc = '%s@%s' % (parts.netloc.rsplit('@', 1)[0], host)
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = '%s:%d' % (netloc, port)
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def url_digest(url):
+    # 64 bit digest of normalized url
+    return int.from_bytes(
+        hashlib.blake2b(normalize_url(url).encode('utf-8'),
+                        digest_size=8).digest(),
+        'little',
+    )
+
+
+class HashSet(object):
+    # exact set of url digests, kept in sorted array, 8 bytes per url, and in
+    # set of recently added ones, about 80 bytes per url, which is merged
+    # into array when it holds more than ``1 / merge_ratio`` of urls, so
+    # together they take from 8 to about 18 bytes per url
+    min_added = 1024
+    merge_ratio = 8
+
+    def __init__(self, data=None):
+        self._digests = array('Q', data or b'')
+        self._added = set()
+
+    def __len__(self):
+        return len(self._digests) + len(self._added)
+
+    def __contains__(self, digest):
+        if digest in self._added:
+            return True
+
+        index = bisect.bisect_left(self._digests, digest)
+        return index < len(self._digests) and \
+            self._digests[index] == digest
+
+    def add(self, digest):
+        if digest in self:
+            return
+
+        self._added.add(digest)
+        if len(self._added) > max(
+                self.min_added, len(self._digests) // self.merge_ratio):
+            self.merge()
+
+    def merge(self):
+        # runs of array between added digests are copied at once
+        digests = array('Q')
+        start = 0
+        for digest in sorted(self._added):
+            end = bisect.bisect_left(self._digests, digest, start)
+            digests.extend(self._digests[start:end])
+            digests.append(digest)
+            start = end
+        digests.extend(self._digests[start:])
+
+        self._digests = digests
+        self._added.clear()
+
+    def to_bytes(self):
+        self.merge()
+        return self._digests.tobytes()
+
+
+class BloomFilter(object):
+    # probabilistic set of url digests, for ``capacity`` urls it gives false
+    # positives (url is considered visited while it wasn't) with probability
+    # of ``error_rate``, takes about 1.2 byte per url for 1% error rate
+    def __init__(self, capacity=1000000, error_rate=0.01, data=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray(data) if data else bytearray(
+            (self.size + 7) // 8,
+        )
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, digest):
+        # double hashing, both hashes are taken from 64 bit digest
+        first, second = digest & 0xffffffff, (digest >> 32) | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def __contains__(self, digest):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def to_bytes(self):
+        return bytes(self._bits)
+
+
+def dump_seen(seen):
+    # returns picklable state of ``HashSet`` or ``BloomFilter``
+    state = {'seen_class': type(seen).__name__, 'seen': seen.to_bytes()}
+    if isinstance(seen, BloomFilter):
+        state['bloom'] = (seen.capacity, seen.error_rate, seen.count)
+
+    return state
+
+
+def load_seen(state):
+    if state['seen_class'] == 'BloomFilter':
+        capacity, error_rate, count = state['bloom']
+        seen = BloomFilter(capacity, error_rate, state['seen'])
+        seen.count = count
+        return seen
+
+    return HashSet(state['seen'])
+
+
+class Frontier(object):
+    # queue of urls to crawl, that remembers which urls were already seen, so
+    # every page is visited once; when ``path`` is given, state is saved there
+    # every ``checkpoint_every`` completed pages and loaded on creation, so
+    # crawl can be resumed; ``seen`` can be ``HashSet`` (default) or
+    # ``BloomFilter`` for millions of urls
+    def __init__(self, path=None, checkpoint_every=100, seen=None):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.seen = HashSet() if seen is None else seen
+        self.pending = collections.deque()
+        # urls that were taken from queue, but not completed yet
+        self.in_progress = collections.OrderedDict()
+        self.completed = 0
+
+        self._lock = threading.Lock()
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __repr__(self):
+        return '%s(%r, pending=%d, seen=%d)' % (
+            self.__class__.__name__, self.path, len(self.pending),
+            len(self.seen),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.checkpoint()
+
+    def __contains__(self, url):
+        return url_digest(url) in self.seen
+
+    @property
+    def has_pending(self):
+        return bool(self.pending or self.in_progress)
+
+    def add(self, url):
+        # adds url to queue, returns False when it was already seen
+        digest = url_digest(url)
+        with self._lock:
+            if digest in self.seen:
+                return False
+
+            self.seen.add(digest)
+            self.pending.append(url)
+            return True
+
+    def pop(self):
+        with self._lock:
+            url = self.pending.popleft()
+            self.in_progress[url] = True
+            return url
+
+    def requeue(self):
+        # puts urls that weren't completed back to the front of queue
+        with self._lock:
+            self.pending.extendleft(reversed(self.in_progress))
+            self.in_progress.clear()
+
+    def complete(self, url):
+        with self._lock:
+            self.in_progress.pop(url, None)
+            self.completed += 1
+            checkpoint = self.path is not None and \
+                self.completed % self.checkpoint_every == 0
+
+        if checkpoint:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            state = dump_seen(self.seen)
+            # pages in progress will be processed again
+            state['pending'] = list(self.in_progress) + list(self.pending)
+            state['completed'] = self.completed
+
+        temporary = '%s.tmp' % self.path
+        with open(temporary, 'wb') as fh:
+            pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        with open(self.path, 'rb') as fh:
+            state = pickle.load(fh)
+
+        self.seen = load_seen(state)
+        self.pending = collections.deque(state['pending'])
+        self.in_progress = collections.OrderedDict()
+        self.completed = state['completed']
+
+
+class FingerprintStore(object):
+    # remembers digest of body of every processed page, with records
+    # extracted from it, pages which didn't change since previous run aren't
+    # parsed again, instead item sets yield records from previous run, or
+    # nothing when ``emit`` is ``'nothing'``; when ``path`` is given, store is
+    # saved there every ``save_every`` updated pages and loaded on creation
+    def __init__(self, path=None, emit='cached', save_every=100):
+        if emit not in ('cached', 'nothing'):
+            raise ScrapperException(
+                '`emit` should be either "cached" or "nothing"'
+            )
+
+        self.path = path
+        self.emit = emit
+        self.save_every = save_every
+        self.unchanged = 0
+        self.changed = 0
+
+        self._entries = {}
+        self._updates = 0
+        self._lock = threading.Lock()
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __repr__(self):
+        return '%s(%r, pages=%d)' % (
+            self.__class__.__name__, self.path, len(self._entries),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(obj, url):
+        # the same page can be processed by different classes
+        cls = obj if isinstance(obj, type) else type(obj)
+        return '%s.%s %s' % (cls.__module__, cls.__qualname__, url)
+
+    @staticmethod
+    def digest(content):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    def lookup(self, key, content):
+        # returns digest of content, and records from previous run when it
+        # didn't change or None
+        digest = self.digest(content)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == digest:
+                self.unchanged += 1
+                return digest, entry[1]
+
+            self.changed += 1
+
+        return digest, None
+
+    def store(self, key, digest, records):
+        with self._lock:
+            self._entries[key] = (digest, records)
+            self._updates += 1
+            save = self.path is not None and \
+                self._updates % self.save_every == 0
+
+        if save:
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            data = pickle.dumps(
+                self._entries, protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        temporary = '%s.tmp' % self.path
+        with open(temporary, 'wb') as fh:
+            fh.write(data)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        with open(self.path, 'rb') as fh:
+            self._entries = pickle.load(fh)
+
+
+class SeenStore(object):
+    # remembers keys of items yielded by incremental paginations, see
+    # ``Pagination.seen_field``; keys added in current run are committed when
+    # it's finished, so interrupted run doesn't hide older items from the
+    # next one, and stopped run doesn't stop the next one at items that
+    # weren't yielded; when ``path`` is given, store is saved there on commit
+    # and loaded on creation; ``seen`` can be ``HashSet`` (default) or
+    # ``BloomFilter``
+    def __init__(self, path=None, seen=None):
+        self.path = path
+        self.seen = HashSet() if seen is None else seen
+        # keys added in current run
+        self.pending = set()
+
+        self._lock = threading.Lock()
+
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __repr__(self):
+        return '%s(%r, seen=%d, pending=%d)' % (
+            self.__class__.__name__, self.path, len(self.seen),
+            len(self.pending),
+        )
+
+    def __len__(self):
+        return len(self.seen)
+
+    def __contains__(self, key):
+        # tells if key was committed in previous run
+        return key in self.seen
+
+    @staticmethod
+    def key(obj, value):
+        # 64 bit digest of value, the same value can be used by different
+        # classes
+        return int.from_bytes(
+            hashlib.blake2b(FingerprintStore.key(obj, value).encode('utf-8'),
+                            digest_size=8).digest(),
+            'little',
+        )
+
+    def add(self, key):
+        # adds key to current run, returns False when it was already seen
+        with self._lock:
+            if key in self.seen or key in self.pending:
+                return False
+
+            self.pending.add(key)
+            return True
+
+    def commit(self):
+        with self._lock:
+            for key in self.pending:
+                self.seen.add(key)
+            self.pending.clear()
+
+        self.save()
+
+    def rollback(self):
+        with self._lock:
+            self.pending.clear()
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self._lock:
+            state = dump_seen(self.seen)
+
+        temporary = '%s.tmp' % self.path
+        with open(temporary, 'wb') as fh:
+            pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        with open(self.path, 'rb') as fh:
+            self.seen = load_seen(pickle.load(fh))
 
 
-class Pagination(object):
+def resolve_fingerprints(obj, caller):
+    if obj.fingerprints is not None:
+        return obj.fingerprints
+
+    return getattr(caller, 'fingerprints', None)
+
+
+class Pagination(object, metaclass=ScrapperMeta):
+    _selectors = ('links_selector', 'next_selector')
+
     url = None
 
     # iterates over this selection, to get items
@@ -188,7 +2379,63 @@ class Pagination(object):
 
     item_class = None
 
-    def __init__(self):
+    # namespaces prefixes used in selectors
+    namespaces = None
+
+    # XPath variables passed when evaluating selectors
+    variables = None
+
+    # instance of ``Fetcher``, shared with created instances of ``item_class``
+    fetcher = None
+
+    # instance of ``Frontier``, when set every page is visited only once, and
+    # crawl can be resumed
+    frontier = None
+
+    # number of pages fetched in background, while current one is processed
+    prefetch = 0
+
+    # instance of ``FingerprintStore`` shared with created instances of
+    # ``item_class``, pages that didn't change aren't parsed by them
+    fingerprints = None
+
+    # number of threads fetching pages and creating instances of
+    # ``item_class``, see ``ItemSet.workers``
+    workers = 0
+    ordered = True
+
+    # when set, created instances of ``item_class`` release pages after
+    # they are processed, see ``Item.detached`` and ``ItemSet.detached``
+    detached = False
+
+    # instance of ``SeenStore``, when set pagination is incremental, only
+    # items whose ``seen_field`` value wasn't seen before are yielded, and
+    # following ``next_selector`` stops at first page which has no new
+    # items; ``prefetch`` and ``workers`` aren't used then
+    seen = None
+    seen_field = None
+
+    def __init__(self, fetcher=None, frontier=None, prefetch=None,
+                 fingerprints=None, seen=None):
+        self.fetcher = resolve_fetcher(fetcher, self.fetcher)
+        if frontier is not None:
+            self.frontier = frontier
+        if prefetch is not None:
+            self.prefetch = prefetch
+        if fingerprints is not None:
+            self.fingerprints = fingerprints
+        if seen is not None:
+            self.seen = seen
+
+        if self.seen is not None and not self.seen_field:
+            raise ScrapperException(
+                'You need to setup `seen_field` for incremental pagination'
+            )
+
+        # responses of pages that ``next_link`` already had to fetch, they
+        # are handed over to ``item_class`` instead of fetching them again
+        self._fetched = {}
+
         if not self.next_selector and not self.links_selector:
             raise ScrapperException(
                 'You should define either`links_selector` or `next_selector`'
@@ -208,16 +2455,30 @@ class Pagination(object):
                 'You need to setup `next_selector` or `self.links_selector`'
             )
 
-        self.response = fetch_data(self.url)
-        self.content = self.response.content
+        if self.frontier is not None and self.frontier.has_pending:
+            # resumed crawl, starting page isn't needed
+            self.response = None
+            self.content = None
+        else:
+            self.response = fetch_data(self.url, self.fetcher)
+            self.content = self.response.content
 
     def next_link(self):
-        parsed = lxml.html.fromstring(self.content)
+        if self.frontier is not None:
+            for next_link in self.frontier_links():
+                yield next_link
+            return
+
+        parsed = parse_content(self.content, self.response)
+
+        variables = self.variables or {}
 
         if self.next_selector:
+            next_xpath = get_xpath(self, 'next_selector')
+            self._fetched[self.url] = self.response
             yield self.url
             while True:
-                selected_next = parsed.xpath(self.next_selector)
+                selected_next = next_xpath(parsed, **variables)
                 if len(selected_next) == 0:
                     raise ScrapperCantFindNext(
                         'Couldn\'t find element by selector "{}"'.format(
@@ -229,13 +2490,16 @@ class Pagination(object):
                 if not REGEXP_LINK.match(next_url):
                     next_url = urljoin(self.url, next_url)
 
-                self.content = fetch_data(next_url).content
-                parsed = lxml.html.fromstring(self.content)
+                self.response = fetch_data(next_url, self.fetcher)
+                self.content = self.response.content
+                parsed = parse_content(self.content, self.response)
 
+                self._fetched[next_url] = self.response
                 yield next_url
 
         if self.links_selector:
-            selected_links = parsed.xpath(self.links_selector)
+            links_xpath = get_xpath(self, 'links_selector')
+            selected_links = links_xpath(parsed, **variables)
 
             if len(selected_links) == 0:
                 raise ScrapperCantFindNext(
@@ -247,7 +2511,728 @@ class Pagination(object):
             for link in selected_links:
                 yield urljoin(self.url, link)
 
+    def frontier_links(self):
+        # yields links from ``frontier``, pages that were already seen are
+        # skipped, so cycles and overlapping links are visited only once
+        frontier = self.frontier
+        variables = self.variables or {}
+
+        if not frontier.has_pending:
+            if self.next_selector:
+                self._fetched[self.url] = self.response
+                frontier.add(self.url)
+            else:
+                parsed = parse_content(self.content, self.response)
+                selected_links = get_xpath(self, 'links_selector')(
+                    parsed, **variables
+                )
+                if len(selected_links) == 0:
+                    raise ScrapperCantFindNext(
+                        'Couldn\'t find element by selector "{}"'.format(
+                            self.links_selector
+                        )
+                    )
+
+                for link in selected_links:
+                    frontier.add(urljoin(self.url, link))
+
+        frontier.requeue()
+
+        missing_next = False
+        while frontier.pending:
+            url = frontier.pop()
+
+            if self.next_selector:
+                self.response = self.fetch_page(url)
+                self.content = self.response.content
+                self._fetched[url] = self.response
+
+                selected_next = get_xpath(self, 'next_selector')(
+                    parse_content(self.content, self.response),
+                    **variables
+                )
+                missing_next = len(selected_next) == 0
+                if not missing_next:
+                    next_url = selected_next[0]
+                    if not REGEXP_LINK.match(next_url):
+                        next_url = urljoin(self.url, next_url)
+
+                    frontier.add(next_url)
+
+            yield url
+
+        if missing_next:
+            raise ScrapperCantFindNext(
+                'Couldn\'t find element by selector "{}"'.format(
+                    self.next_selector,
+                )
+            )
+
+    def complete(self, url):
+        # marks page as processed
+        if self.frontier is not None:
+            self.frontier.complete(url)
+
+    def discard(self, url):
+        # drops response of page fetched by ``next_link``, when it won't be
+        # processed by ``create_item``
+        self._fetched.pop(url, None)
+
+    def fetch_page(self, url):
+        response = self._fetched.pop(url, None)
+        if response is None:
+            response = fetch_data(url, resolve_fetcher(
+                self.item_class.fetcher, self.fetcher,
+            ))
+
+        return response
+
+    def pages(self):
+        # yields (url, response) of pages that would be processed, with
+        # ``prefetch`` set they are fetched in background thread
+        pages = (
+            (next_link, self.fetch_page(next_link))
+            for next_link in self.next_link()
+        )
+        if self.prefetch:
+            pages = read_ahead(pages, self.prefetch)
+
+        for next_link, response in pages:
+            yield next_link, response
+            self.complete(next_link)
+
+    def create_item(self, url, response=None):
+        if response is None:
+            response = self._fetched.pop(url, None)
+
+        # pylint: disable=not-callable
+        return self.item_class(url, self, response=response)
+
     def __iter__(self):
+        if self.seen is not None:
+            for item in self.iter_incremental():
+                yield item
+            return
+
+        if self.workers:
+            for next_link, item in fan_out(
+                    self.create_item, ((url,) for url in self.next_link()),
+                    self.workers, self.ordered):
+                yield item
+                if not isinstance(item, ScrapperItemError):
+                    self.complete(next_link)
+            return
+
+        if self.prefetch:
+            for next_link, response in self.pages():
+                yield self.create_item(next_link, response)
+            return
+
         for next_link in self.next_link():
-            # pylint: disable=not-callable
-            yield self.item_class(next_link, self)
+            yield self.create_item(next_link)
+            self.complete(next_link)
+
+    def iter_incremental(self):
+        # yields instances of ``item_class`` with new items only, keys of
+        # yielded items are committed to ``seen`` when pages run out, or at
+        # first page without new items
+        links = self.next_link()
+        try:
+            for next_link in links:
+                item = self.create_item(next_link)
+                children = self.new_items(item)
+                if children is None:
+                    if self.next_selector:
+                        # pages after this one were seen in previous runs
+                        break
+                    continue
+
+                if isinstance(item, ItemSet):
+                    item.created = children
+                if children:
+                    yield item
+                self.complete(next_link)
+        except ScrapperCantFindNext:
+            # whole history was crawled
+            self.seen.commit()
+            raise
+        except BaseException:
+            self.seen.rollback()
+            raise
+        finally:
+            links.close()
+
+        self.seen.commit()
+
+    def new_items(self, item):
+        # returns items of created instance of ``item_class`` that weren't
+        # seen before, or None when it has no new items and some of them
+        # were seen in previous runs, other could be moved from previous page
+        # in the meantime
+        children = [item] if isinstance(item, Item) else list(item)
+        new, previous = [], 0
+        for child in children:
+            if isinstance(child, ScrapperItemError):
+                new.append(child)
+                continue
+
+            if isinstance(child, dict):
+                value = child[self.seen_field]
+            else:
+                value = getattr(child, self.seen_field)
+
+            key = self.seen.key(self, value)
+            if key in self.seen:
+                previous += 1
+            elif self.seen.add(key):
+                new.append(child)
+
+        if previous and not new:
+            return None
+
+        return new
+
+    async def aiter(self, concurrency=32, per_host=None, ordered=False):
+        # fetches pages and creates ``item_class`` instances concurrently,
+        # yields them as they are completed, or in order of ``next_link``
+        # when ``ordered`` is set
+        loop = asyncio.get_running_loop()
+        fetcher = AsyncFetcher(self.fetcher, concurrency, per_host)
+        links = self.next_link()
+        done = object()
+        error = None
+        tasks = collections.deque()
+
+        async def create_item(url):
+            response = self._fetched.pop(url, None)
+            if response is None:
+                response = await fetcher.fetch(url)
+
+            return url, await fetcher.run(self.create_item, url, response)
+
+        with fetcher:
+            try:
+                while True:
+                    try:
+                        # ``next_link`` may need to fetch pages by itself
+                        url = await fetcher.run(next, links, done)
+                    except Exception as exc:  # pylint: disable=broad-except
+                        # raised after pages that are already being processed
+                        error = exc
+                        break
+
+                    if url is done:
+                        break
+
+                    tasks.append(loop.create_task(create_item(url)))
+
+                    while len(tasks) >= concurrency:
+                        for url, item in await self._completed(
+                                tasks, ordered):
+                            yield item
+                            self.complete(url)
+
+                while tasks:
+                    for url, item in await self._completed(tasks, ordered):
+                        yield item
+                        self.complete(url)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        if error is not None:
+            raise error
+
+    @staticmethod
+    async def _completed(tasks, ordered):
+        if ordered:
+            return [await tasks.popleft()]
+
+        done, _ = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in done:
+            tasks.remove(task)
+
+        return [task.result() for task in done]
+
+
+def iter_records(obj):
+    # yields ``as_dict()`` of items, from nested item sets and paginations too,
+    # records that are already extracted are passed as they are
+    if isinstance(obj, Item):
+        yield obj.as_dict()
+        return
+
+    if isinstance(obj, dict):
+        yield obj
+        return
+
+    if isinstance(obj, ScrapperItemError):
+        # item couldn't be created, error was already handed to consumer
+        return
+
+    for child in obj:
+        for record in iter_records(child):
+            yield record
+
+
+def extract_records(item_class, documents):
+    # returns list of records for every (url, content) in documents, run in
+    # worker processes of ``ProcessPipeline``
+    return [
+        list(iter_records(item_class(url, content=content)))
+        for url, content in documents
+    ]
+
+
+class ProcessPipeline(object):
+    # fetches pages in current process, and parses them and extracts records
+    # in pool of ``workers`` processes, pages are sent in batches of
+    # ``batch_size``, ``item_class`` and its callbacks need to be picklable
+    def __init__(self, item_class, workers=None, batch_size=16,
+                 max_pending=None, fetcher=None):
+        if not issubclass(item_class, (Item, ItemSet)):
+            raise ScrapperException(
+                '`item_class` need to be instance of `Item` or `ItemSet`'
+            )
+
+        self.item_class = item_class
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        # how many batches can wait for workers at once
+        self.max_pending = max_pending or 2 * self.workers
+        self.fetcher = fetcher
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _batches(self, documents):
+        batch = []
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def extract(self, documents):
+        # yields records extracted from (url, content) pairs, in order
+        pending = collections.deque()
+        for batch in self._batches(documents):
+            pending.append(self._executor.submit(
+                extract_records, self.item_class, batch,
+            ))
+
+            while len(pending) >= self.max_pending:
+                for records in pending.popleft().result():
+                    for record in records:
+                        yield record
+
+        while pending:
+            for records in pending.popleft().result():
+                for record in records:
+                    yield record
+
+    def crawl(self, source):
+        # yields records from pages of ``Pagination`` instance or from urls
+        if isinstance(source, Pagination):
+            pages = source.pages()
+        else:
+            pages = (
+                (url, fetch_data(url, self.fetcher)) for url in source
+            )
+
+        return self.extract(
+            (url, response.content) for url, response in pages
+        )
+
+
+class SQLiteWorkQueue(object):
+    # queue of urls shared by ``Coordinator`` and ``Worker`` instances, that
+    # may run in many processes, urls are leased by workers for
+    # ``lease_time`` seconds, and leased again by other ones when they aren't
+    # completed in time, failed and expired urls are repeated up to
+    # ``max_attempts`` times; other backends need to provide the same methods
+    def __init__(self, path, lease_time=60.0, max_attempts=3):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+
+        self._local = threading.local()
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                url TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state
+                ON tasks (state, lease_until);
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                task_id INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.path)
+
+    @property
+    def _db(self):
+        # connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+
+        return db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        else:
+            db.execute('COMMIT')
+
+    def add(self, urls):
+        # adds urls that weren't added yet, returns number of added ones
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                'INSERT OR IGNORE INTO tasks (key, url) VALUES (?, ?)',
+                ((normalize_url(url), url) for url in urls),
+            )
+            return db.total_changes - before
+
+    def close_input(self):
+        # tells workers that no more urls will be added
+        with self._transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (\'input_closed\', 1)'
+            )
+
+    def lease(self, worker, count=1):
+        # returns up to ``count`` of (task id, url) for worker, pending ones,
+        # or ones whose lease expired, unless they were leased too many times,
+        # i.e. they crash workers
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'UPDATE tasks SET state = \'failed\', lease_until = NULL, '
+                'error = COALESCE(error, \'lease expired\') '
+                'WHERE state = \'leased\' AND lease_until < ? '
+                'AND attempts >= ?', (now, self.max_attempts),
+            )
+            tasks = db.execute(
+                'SELECT id, url FROM tasks WHERE state = \'pending\' OR '
+                '(state = \'leased\' AND lease_until < ?) '
+                'ORDER BY id LIMIT ?', (now, count),
+            ).fetchall()
+            db.executemany(
+                'UPDATE tasks SET state = \'leased\', worker = ?, '
+                'lease_until = ?, attempts = attempts + 1 WHERE id = ?',
+                ((worker, now + self.lease_time, task_id)
+                 for task_id, _ in tasks),
+            )
+
+        return tasks
+
+    def complete(self, task_id, worker, records):
+        # stores records of task, returns False when lease of worker expired
+        # and task was leased by other worker
+        with self._transaction() as db:
+            updated = db.execute(
+                'UPDATE tasks SET state = \'done\', lease_until = NULL '
+                'WHERE id = ? AND worker = ? AND state = \'leased\'',
+                (task_id, worker),
+            ).rowcount
+            if updated:
+                db.executemany(
+                    'INSERT INTO records (task_id, data) VALUES (?, ?)',
+                    ((task_id, json.dumps(record, default=str))
+                     for record in records),
+                )
+
+        return bool(updated)
+
+    def fail(self, task_id, worker, error):
+        # task is leased again, unless it failed too many times
+        with self._transaction() as db:
+            db.execute(
+                'UPDATE tasks SET state = CASE WHEN attempts >= ? '
+                'THEN \'failed\' ELSE \'pending\' END, error = ?, '
+                'lease_until = NULL WHERE id = ? AND worker = ? '
+                'AND state = \'leased\'',
+                (self.max_attempts, str(error), task_id, worker),
+            )
+
+    def records(self, after=0, limit=1000):
+        # returns (id, record) of records stored after one with given id
+        return [
+            (record_id, json.loads(data))
+            for record_id, data in self._db.execute(
+                'SELECT id, data FROM records WHERE id > ? ORDER BY id '
+                'LIMIT ?', (after, limit),
+            )
+        ]
+
+    def counts(self):
+        counts = dict.fromkeys(('pending', 'leased', 'done', 'failed'), 0)
+        counts.update(self._db.execute(
+            'SELECT state, COUNT(*) FROM tasks GROUP BY state',
+        ))
+        return counts
+
+    def failures(self):
+        return self._db.execute(
+            'SELECT url, error FROM tasks WHERE state = \'failed\' '
+            'ORDER BY id',
+        ).fetchall()
+
+    @property
+    def finished(self):
+        # all urls were added and processed
+        closed = self._db.execute(
+            'SELECT value FROM meta WHERE key = \'input_closed\'',
+        ).fetchone()
+        counts = self.counts()
+        return bool(closed) and not counts['pending'] and \
+            not counts['leased']
+
+    def close(self):
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class Coordinator(object):
+    # puts links of ``pagination`` to ``queue`` processed by ``Worker``
+    # instances, possibly on other machines, and collects their records
+    def __init__(self, pagination, queue):
+        self.pagination = pagination
+        self.queue = queue
+
+    def run(self):
+        # adds all links, returns number of new ones
+        added = 0
+        try:
+            for url in self.pagination.next_link():
+                added += self.queue.add([url])
+                # pages are fetched again by workers
+                self.pagination.discard(url)
+        except ScrapperCantFindNext:
+            if not self.pagination.next_selector:
+                raise
+            # ``next_selector`` pages end with page without next link
+
+        self.queue.close_input()
+        return added
+
+    def results(self, poll_interval=0.5):
+        # yields records stored by workers, until all urls are processed
+        last = 0
+        while True:
+            finished = self.queue.finished
+            records = self.queue.records(last)
+            for last, record in records:
+                yield record
+
+            if finished and not records:
+                return
+            if not records:
+                sleep(poll_interval)
+
+
+class Worker(object):
+    # takes urls from ``queue`` and extracts records from them with
+    # ``item_class``, ``batch_size`` urls at once, until queue is finished
+    def __init__(self, item_class, queue, name=None, fetcher=None,
+                 batch_size=1):
+        if not issubclass(item_class, (Item, ItemSet)):
+            raise ScrapperException(
+                '`item_class` need to be instance of `Item` or `ItemSet`'
+            )
+
+        self.item_class = item_class
+        self.queue = queue
+        self.name = name or '%s-%d-%d' % (
+            socket.gethostname(), os.getpid(), threading.get_ident(),
+        )
+        self.fetcher = fetcher
+        self.batch_size = batch_size
+        self.processed = 0
+        self.failed = 0
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.name)
+
+    def process(self, url):
+        return list(iter_records(self.item_class(url, fetcher=self.fetcher)))
+
+    def run(self, max_tasks=None, poll_interval=0.5):
+        # returns number of processed urls
+        while max_tasks is None or self.processed + self.failed < max_tasks:
+            count = self.batch_size
+            if max_tasks is not None:
+                count = min(count, max_tasks - self.processed - self.failed)
+
+            tasks = self.queue.lease(self.name, count)
+            if not tasks:
+                if self.queue.finished:
+                    break
+                sleep(poll_interval)
+                continue
+
+            for task_id, url in tasks:
+                try:
+                    records = self.process(url)
+                except Exception as exc:  # pylint: disable=broad-except
+                    self.failed += 1
+                    self.queue.fail(task_id, self.name, exc)
+                else:
+                    self.processed += 1
+                    self.queue.complete(task_id, self.name, records)
+
+        return self.processed
+
+
+class Sink(object):
+    # writes records to file object, or to file with given name
+    newline = None
+
+    def __init__(self, fh):
+        self._own_file = isinstance(fh, str)
+        self.fh = open(fh, 'w', encoding='utf-8', newline=self.newline) \
+            if self._own_file else fh
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.flush()
+        if self._own_file:
+            self.fh.close()
+
+
+class JSONLinesSink(Sink):
+    def write(self, record):
+        self.fh.write(json.dumps(record, ensure_ascii=False, default=str))
+        self.fh.write('\n')
+        self.count += 1
+
+
+class CSVSink(Sink):
+    # when ``fieldnames`` are not given, keys of first record are used, and
+    # record with other fields raises exception, since they can't be added
+    # to header that is already written; when they are given, other fields
+    # are skipped
+    newline = ''
+
+    def __init__(self, fh, fieldnames=None):
+        super(CSVSink, self).__init__(fh)
+        self.fieldnames = fieldnames
+        self._writer = None
+
+    def write(self, record):
+        if self._writer is None:
+            self._writer = csv.DictWriter(
+                self.fh, self.fieldnames or list(record),
+                extrasaction='ignore',
+            )
+            self._writer.writeheader()
+        elif self.fieldnames is None:
+            extra = record.keys() - self._writer.fieldnames
+            if extra:
+                raise ScrapperException(
+                    'Record has fields missing in CSV header: %s, pass them '
+                    'in `fieldnames`' % ', '.join(sorted(extra))
+                )
+
+        self._writer.writerow(record)
+        self.count += 1
+
+
+class BufferedSink(object):
+    # collects records and passes them to ``sink`` in batches of
+    # ``flush_size``, flushing it after every batch
+    def __init__(self, sink, flush_size=1000):
+        self.sink = sink
+        self.flush_size = flush_size
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def count(self):
+        return self.sink.count + len(self._buffer)
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        for record in self._buffer:
+            self.sink.write(record)
+
+        self._buffer = []
+        self.sink.flush()
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+def export(source, sink):
+    # writes records from ``Pagination``, ``ItemSet``, ``Item`` or iterable of
+    # records as soon as they are extracted, items are dropped right after
+    # that, returns number of written records
+    count = 0
+    for record in iter_records(source):
+        sink.write(record)
+        count += 1
+
+    sink.flush()
+    return count
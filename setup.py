@@ -12,9 +12,10 @@ setup(
     description='Scrapper is small, Python web scraping library',
     py_modules=['scrapper'],
     keywords='scrapper,scraping,webscraping',
+    python_requires='>=3.7',
     install_requires=[
-        'lxml == 3.6.1',
-        'requests == 2.20.0',
+        'lxml >= 4.2.5',
+        'requests >= 2.20.0',
     ],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -22,10 +23,13 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Topic :: Internet :: WWW/HTTP',
         'Topic :: Internet :: WWW/HTTP :: Indexing/Search',
         'Topic :: Software Development :: Libraries :: Python Modules',
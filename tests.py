@@ -1,16 +1,30 @@
+import asyncio
+import collections
 import copy
+import io
+import json
+import functools
+import os
+import shutil
+import socket
+import tempfile
+import threading
 import unittest
-from mock import patch
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from mock import Mock, patch
 from datetime import datetime
+from time import sleep
 
 import lxml.etree
 import requests
 
 import scrapper
 
+REQUESTS_SESSION_GET = requests.Session.get
+
 
 def monkey_patch_requests_get():
-    def monkey_patch_get(uri, *args, **kwargs):
+    def monkey_patch_get(session, uri, *args, **kwargs):
         with open('./fixtures/%s' % uri) as fh:
             extra_dict = {
                 'content': fh.read(),
@@ -23,7 +37,7 @@ def monkey_patch_requests_get():
             extra_dict,
         )()
 
-    setattr(requests, 'get', monkey_patch_get)
+    setattr(requests.Session, 'get', monkey_patch_get)
 
 
 class BaseTestCase(unittest.TestCase):
@@ -32,6 +46,60 @@ class BaseTestCase(unittest.TestCase):
         monkey_patch_requests_get()
 
 
+class PipelineEntry(scrapper.Item):
+    name = scrapper.Field(
+        '//h1/text()', lambda value, _, __: value.upper() if value else None,
+    )
+
+
+class PipelineEntries(scrapper.ItemSet):
+    item_class = PipelineEntry
+    content_selector = '//div[@class="entry"]'
+
+
+class PipelinePagination(scrapper.Pagination):
+    url = 'page_index.html'
+    item_class = PipelineEntries
+    links_selector = '//a/@href'
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+    # serves fixtures over HTTP, using real ``requests``
+    handler_class = QuietHTTPRequestHandler
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            functools.partial(cls.handler_class, directory='./fixtures'),
+        )
+        cls.server.daemon_threads = True
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever)
+        cls.server_thread.daemon = True
+        cls.server_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = patch.object(requests.Session, 'get', REQUESTS_SESSION_GET)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.fetcher = scrapper.Fetcher()
+        self.addCleanup(self.fetcher.close)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d/%s' % (self.server.server_port, path)
+
+
 class TestField(BaseTestCase):
     def test_raises_exception(self):
         with self.assertRaises(ValueError):
@@ -56,6 +124,31 @@ class TestField(BaseTestCase):
         field = scrapper.Field('//h1/text()')
         self.assertEqual('Field(\'//h1/text()\', None)', repr(field))
 
+    def test_selector_is_compiled(self):
+        field = scrapper.Field('//h1/text()')
+
+        self.assertIsInstance(field._xpath, lxml.etree.XPath)
+        self.assertEqual(field._xpath.path, '//h1/text()')
+        self.assertIs(copy.deepcopy(field)._xpath, field._xpath)
+
+    def test_invalid_selector(self):
+        with self.assertRaises(lxml.etree.XPathSyntaxError):
+            scrapper.Field('//h1[')
+
+    def test_namespaces_and_variables(self):
+        field = scrapper.Field(
+            '//x:entry[@id=$entry_id]/text()',
+            namespaces={'x': 'http://example.org/ns'},
+            variables={'entry_id': 'b'},
+        )
+        content = lxml.etree.fromstring(
+            '<feed xmlns="http://example.org/ns">'
+            '<entry id="a">A</entry><entry id="b">B</entry></feed>'
+        )
+        field.process(content, None)
+
+        self.assertEqual(field.__get__(None), 'B')
+
 
 class TestItem(BaseTestCase):
     def test_deepcopy(self):
@@ -76,7 +169,7 @@ class TestItem(BaseTestCase):
         self.assertIsNone(item.title)
 
     def test_proper_initialization(self):
-        with patch('requests.get') as mock:
+        with patch('requests.Session.get') as mock:
             mocked_get = mock.return_value
             mocked_get.status_code = 200
             mocked_get.content = '<html><body>' \
@@ -98,7 +191,7 @@ class TestItem(BaseTestCase):
         class TestCrawlerClass(scrapper.Item):
             title = scrapper.Field('//h1/text()')
 
-        with patch('requests.get') as mock:
+        with patch('requests.Session.get') as mock:
             mocked_get = mock.return_value
             mocked_get.status_code = 200
             mocked_get.content = '<html><body>' \
@@ -126,7 +219,7 @@ class TestItem(BaseTestCase):
                 lambda value, content, response: value.strip(),
             )
 
-        with patch('requests.get') as mock:
+        with patch('requests.Session.get') as mock:
             mocked_get = mock.return_value
             mocked_get.status_code = 200
             with open('./fixtures/single_entry.html') as fh:
@@ -157,6 +250,554 @@ class TestItem(BaseTestCase):
             },
         )
 
+    def test_lazy_evaluation(self):
+        calls = []
+
+        def callback(value, content, response):
+            calls.append(value)
+            return value
+
+        class TestCrawlerClass(scrapper.Item):
+            lazy = True
+
+            title = scrapper.Field('//div[@class="wrap"]/h1/text()', callback)
+            author = scrapper.Field('//div[@class="wrap"]/a/text()', callback)
+
+        item = TestCrawlerClass('single_entry.html')
+        self.assertEqual(calls, [])
+
+        self.assertEqual(item.title, 'Title')
+        self.assertEqual(item.title, 'Title')
+        self.assertEqual(calls, ['Title'])
+
+        self.assertEqual(
+            item.as_dict(), {'title': 'Title', 'author': 'Author field'},
+        )
+        self.assertEqual(calls, ['Title', 'Author field'])
+
+        TestCrawlerClass('single_entry.html', lazy=False)
+        self.assertEqual(len(calls), 4)
+
+    def test_fields_subset(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//div[@class="wrap"]/h1/text()')
+            author = scrapper.Field('//div[@class="wrap"]/a/text()')
+
+        item = TestCrawlerClass('single_entry.html', fields=['author'])
+
+        self.assertEqual(item.as_dict(), {'author': 'Author field'})
+
+        with self.assertRaises(scrapper.ScrapperException):
+            TestCrawlerClass('single_entry.html', fields=['body'])
+
+    def test_fields_are_shared(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//div[@class="wrap"]/h1/text()')
+
+        first = TestCrawlerClass('single_entry.html')
+        second = TestCrawlerClass('single_entry.html')
+        second.title = 'Changed'
+
+        self.assertEqual(first.title, 'Title')
+        self.assertEqual(second.title, 'Changed')
+        self.assertEqual(TestCrawlerClass._field_names, ('title',))
+        self.assertEqual(vars(first), {})
+
+    def test_inherited_fields(self):
+        title = scrapper.Field('//div[@class="wrap"]/h1/text()')
+
+        class TestBaseClass(scrapper.Item):
+            author = scrapper.Field('//div[@class="wrap"]/a/text()')
+            content = scrapper.Field('//div[@class="content"]/text()')
+
+        class TestCrawlerClass(TestBaseClass):
+            content = None
+            header = title
+            heading = title
+
+        item = TestCrawlerClass('single_entry.html')
+
+        self.assertEqual(
+            TestCrawlerClass._field_names, ('author', 'header', 'heading'),
+        )
+        self.assertEqual(item.as_dict(), {
+            'author': 'Author field',
+            'header': 'Title',
+            'heading': 'Title',
+        })
+
+
+class TestDetached(BaseTestCase):
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = 'page_index.html'
+            item_class = TestItemSet
+            links_selector = '//a/@href'
+            detached = True
+
+        self.item_class = TestCrawlerClass
+        self.item_set_class = TestItemSet
+        self.pagination_class = TestPagination
+
+    def test_item(self):
+        self.item_class.detached = True
+        item = self.item_class('single_entry.html', lazy=True)
+
+        self.assertIsNone(item._content)
+        self.assertIsNone(item._response)
+        self.assertEqual(item._values, [item.title])
+        self.assertEqual(item.as_dict(), {'title': 'Title'})
+
+    def test_str_subclasses_are_kept(self):
+        class Markup(str):
+            pass
+
+        class TestMarkupClass(self.item_class):
+            markup = scrapper.Field(
+                '//h1/text()', lambda value, _, __: Markup(value),
+            )
+
+        item = TestMarkupClass('single_entry.html')
+        item.release()
+        self.assertIs(type(item.title), str)
+        self.assertIs(type(item.markup), Markup)
+        self.assertEqual(item.markup, 'Title')
+
+    def test_item_set(self):
+        item_sets = list(self.pagination_class())
+        for item_set in item_sets:
+            self.assertTrue(item_set.detached)
+            self.assertIsNotNone(item_set.content)
+
+        items = [item for item_set in item_sets for item in item_set]
+        self.assertEqual(len(items), 16)
+        for item_set in item_sets:
+            self.assertIsNone(item_set.content)
+            self.assertIsNone(item_set.response)
+            with self.assertRaises(scrapper.ScrapperException):
+                list(item_set)
+
+        for item in items:
+            self.assertIsNone(item._caller)
+            self.assertIsNone(item._content)
+            # smart strings would keep element alive
+            self.assertIs(type(item.title), str)
+
+        self.assertEqual(
+            [item.title for item in items],
+            [
+                item.title
+                for url in ('page_1.html', 'page_2.html', 'page_3.html')
+                for item in self.item_set_class(url)
+            ],
+        )
+
+
+class TestExtractionPlan(BaseTestCase):
+    content = '<html><body><ul>' \
+              '<li class="link"><div class="lcontrast m-reset">' \
+              '<h2><a href="/1">First</a></h2><p>One</p><p>Two</p></div>' \
+              '</li><li class="link"><div class="lcontrast">' \
+              '<h2><a href="/2">Second</a></h2><span>Three</span></div>' \
+              '</li></ul></body></html>'
+
+    def values(self, item_class, content=None):
+        item = item_class('http://dummy.org', content=content or self.content)
+        with patch.object(item_class, '_plan', None):
+            expected = item_class(
+                'http://dummy.org', content=content or self.content,
+            ).as_dict()
+
+        self.assertEqual(item.as_dict(), expected)
+        return expected
+
+    def test_split_path(self):
+        self.assertEqual(
+            scrapper.split_path('//div[contains(@class, "a/b")]//p/@href'),
+            [('//', 'div[contains(@class, "a/b")]'), ('//', 'p'),
+             ('/', '@href')],
+        )
+        for selector in ('//a | //b', 'string(//a)', '(//a)[1]', '//a[1'):
+            self.assertIsNone(scrapper.split_path(selector))
+
+    def test_common_prefix(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]/h2/a/text()',
+                lambda value, _, __: value.upper(),
+            )
+            link = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]/h2/a/@href',
+            )
+            first = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]/p',
+                lambda value, _, __: value.text,
+            )
+            second = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]/p[2]/text()',
+            )
+            span = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]//span/text()',
+            )
+            missing = scrapper.Field(
+                '//div[contains(@class, "lcontrast")]/h3/text()',
+            )
+            other = scrapper.Field('//ul/li[2]/@class')
+
+        plan = TestCrawlerClass._plan
+        self.assertEqual(
+            [prefix for prefix, _, _ in plan.groups],
+            ['//div[contains(@class, "lcontrast")]'],
+        )
+        self.assertNotIn('other', plan.names)
+
+        with patch.object(
+            scrapper.Field, 'extract', wraps=scrapper.Field.extract,
+            autospec=True,
+        ) as mock:
+            item = TestCrawlerClass('http://dummy.org', content=self.content)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(item.as_dict(), {
+            'title': 'FIRST', 'link': '/1', 'first': 'One',
+            'second': 'Two', 'span': 'Three', 'missing': None,
+            'other': 'link',
+        })
+        self.values(TestCrawlerClass)
+
+    def test_fallback(self):
+        class TestCrawlerClass(scrapper.Item):
+            # contexts are nested
+            title = scrapper.Field('//div/p/text()')
+            text = scrapper.Field('//div/span/text()')
+            # leaves context
+            parent = scrapper.Field('//ul/li/../@class')
+            sibling = scrapper.Field('//ul/li/following-sibling::li/text()')
+
+        content = '<html><body><div><div><p>Inner</p></div><p>Outer</p>' \
+                  '<span>Text</span></div>' \
+                  '<ul class="list"><li>1</li><li>2</li></ul></body></html>'
+
+        self.assertEqual(
+            [prefix for prefix, _, _ in TestCrawlerClass._plan.groups],
+            ['//div'],
+        )
+        self.assertEqual(self.values(TestCrawlerClass, content), {
+            'title': 'Inner', 'text': 'Text', 'parent': 'list',
+            'sibling': '2',
+        })
+
+
+class TestExtractMany(BaseTestCase):
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+            upper = scrapper.Field(
+                '//h1/text()', lambda value, _, __: value.upper(),
+            )
+
+        self.item_class = TestCrawlerClass
+        self.documents = [
+            ('http://dummy.org/%d' % index,
+             '<div class="entry"><h1>Entry %d</h1></div>' % index)
+            for index in range(3)
+        ]
+
+    def test_records(self):
+        records = self.item_class.extract_many(iter(self.documents))
+
+        self.assertEqual(records, [
+            self.item_class(url, content=content).as_dict()
+            for url, content in self.documents
+        ])
+        self.assertEqual(records[1], {'title': 'Entry 1', 'upper': 'ENTRY 1'})
+
+    def test_columns(self):
+        self.assertEqual(
+            self.item_class.extract_many(
+                self.documents, fields=['upper'], columns=True,
+            ),
+            {'upper': ['ENTRY 0', 'ENTRY 1', 'ENTRY 2']},
+        )
+        self.assertEqual(
+            self.item_class.extract_many(self.documents, fields=[]),
+            [{}, {}, {}],
+        )
+
+        with self.assertRaises(scrapper.ScrapperException):
+            self.item_class.extract_many(self.documents, fields=['body'])
+
+    def test_stats(self):
+        stats = scrapper.Stats()
+        with patch.object(scrapper, 'STATS', stats):
+            records = self.item_class.extract_many(self.documents)
+
+        self.assertEqual(records, self.item_class.extract_many(self.documents))
+        self.assertEqual(stats.counters['items'], 3)
+        self.assertEqual(
+            stats.as_dict()['timings']['field_callback'][
+                'TestCrawlerClass.upper'
+            ]['count'],
+            3,
+        )
+
+
+class TestItemSet(BaseTestCase):
+    def test_selector_is_compiled(self):
+        class TestItemSet(scrapper.ItemSet):
+            item_class = scrapper.Item
+            content_selector = '//div[@class="entry"]'
+
+        xpath = TestItemSet._xpaths['content_selector']
+        self.assertIsInstance(xpath, lxml.etree.XPath)
+        self.assertIs(
+            scrapper.get_xpath(TestItemSet('page_1.html'), 'content_selector'),
+            xpath,
+        )
+
+    def test_overridden_selector(self):
+        class TestItemSet(scrapper.ItemSet):
+            item_class = scrapper.Item
+            content_selector = '//div[@class="entry"]'
+
+        item_set = TestItemSet('page_1.html')
+        item_set.content_selector = '//div[@class="entry"][1]'
+
+        self.assertEqual(len(list(item_set)), 1)
+
+    def test_items_use_parsed_elements(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+            relative_title = scrapper.Field('.//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        item_set = TestItemSet('page_1.html')
+        with patch('lxml.html.fromstring', wraps=lxml.html.fromstring) as mock:
+            items = list(item_set)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(
+            [(item.title, item.relative_title) for item in items],
+            [
+                ('Auguste Eichmann', 'Auguste Eichmann'),
+                ('Dominick Von', 'Dominick Von'),
+                ('Scottie Skiles', 'Scottie Skiles'),
+                ('Almon Tromp', 'Almon Tromp'),
+            ],
+        )
+        self.assertEqual(items[0]._content.tag, 'div')
+
+    def test_nested_elements(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div'
+
+        content = '<html><body><div><h1>Outer</h1>' \
+                  '<div><h1>Inner</h1></div></div></body></html>'
+        items = list(TestItemSet('http://dummy.org', content=content))
+
+        self.assertEqual([item.title for item in items], ['Outer', 'Inner'])
+
+    def test_nested_item_sets(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestInnerItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestInnerItemSet
+            content_selector = '//body'
+
+        item_set = list(TestItemSet('page_1.html'))[0]
+        first = [item.title for item in item_set]
+        second = [item.title for item in item_set]
+
+        self.assertEqual(len(first), 4)
+        self.assertEqual(first, second)
+
+
+class TestParser(unittest.TestCase):
+    content = '<html><head><meta charset="utf-8"></head><body>' \
+              '<!-- comment --><div class="entry">' \
+              '<h1>Zażółć gęślą jaźń</h1></div></body></html>'
+
+    def response(self, content_type, encoding='iso-8859-2'):
+        return type(str('mocked_requests'), (object,), {
+            'content': self.content.encode(encoding),
+            'status_code': 200,
+            'headers': {'Content-Type': content_type},
+        })()
+
+    def test_encoding_from_headers(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        # header takes precedence over page
+        response = self.response('text/html; charset=ISO-8859-2')
+        self.assertEqual(scrapper.response_encoding(response), 'ISO-8859-2')
+        self.assertEqual(
+            TestCrawlerClass('http://dummy.org', response=response).title,
+            'Zażółć gęślą jaźń',
+        )
+
+        # without charset page is trusted, not ``requests`` default
+        response = self.response('text/html', 'utf-8')
+        self.assertIsNone(scrapper.response_encoding(response))
+        self.assertEqual(
+            TestCrawlerClass('http://dummy.org', response=response).title,
+            'Zażółć gęślą jaźń',
+        )
+
+        invalid = {'Content-Type': 'text/html; charset=unknown'}
+        for headers in (None, Mock(), invalid):
+            self.assertIsNone(scrapper.response_encoding(
+                type(str('mocked_requests'), (object,), {'headers': headers}),
+            ))
+
+    def test_charset_is_passed_as_given(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        self.content = '<html><head><meta charset="euc-jp"></head><body>' \
+                       '<h1>\u65e5\u672c\u8a9e</h1></body></html>'
+        # Python names this codec ``euc_jp``, libxml2 doesn't know this name,
+        # then page is trusted
+        for charset in ('euc-jp', 'EUC-JP', 'euc_jp'):
+            response = self.response(
+                'text/html; charset=%s' % charset, 'euc_jp',
+            )
+            self.assertEqual(
+                TestCrawlerClass('http://dummy.org', response=response).title,
+                '\u65e5\u672c\u8a9e',
+            )
+
+        self.assertEqual(scrapper.response_encoding(response), None)
+        self.assertEqual(scrapper.response_encoding(self.response(
+            'text/html; charset=euc-kr', 'euc_kr',
+        )), 'euc-kr')
+
+    def test_parsers_are_reused(self):
+        parser = scrapper.get_parser()
+        self.assertIs(scrapper.get_parser(), parser)
+        self.assertIsNot(scrapper.get_parser('utf-8'), parser)
+
+        parsers = []
+        thread = threading.Thread(
+            target=lambda: parsers.append(scrapper.get_parser()),
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(parsers[0], parser)
+
+    def test_options(self):
+        with patch.object(
+            scrapper, 'PARSER_OPTIONS', {'remove_comments': True},
+        ):
+            parsed = scrapper.parse_content(self.content)
+
+        self.assertEqual(parsed.xpath('//comment()'), [])
+        self.assertEqual(
+            len(scrapper.parse_content(self.content).xpath('//comment()')), 1,
+        )
+
+
+class TestStreamingItemSet(LocalServerTestCase):
+    def setUp(self):
+        super(TestStreamingItemSet, self).setUp()
+
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+            relative_title = scrapper.Field('.//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+            fetcher = self.fetcher
+
+        class TestStreamedItemSet(TestItemSet):
+            streaming = True
+            chunk_size = 64
+
+        self.item_set_class = TestItemSet
+        self.streaming_class = TestStreamedItemSet
+
+    def titles(self, item_set):
+        return [(item.title, item.relative_title) for item in item_set]
+
+    def test_same_items(self):
+        with open('./fixtures/page_2.html', 'rb') as fh:
+            content = fh.read()
+
+        expected = self.titles(self.item_set_class('page_2', content=content))
+        self.assertEqual(len(expected), 7)
+        self.assertEqual(
+            self.titles(self.streaming_class('page_2', content=content)),
+            expected,
+        )
+
+        with patch.object(
+            self.fetcher.session, 'get', wraps=self.fetcher.session.get,
+        ) as mock:
+            item_set = self.streaming_class(self.url('page_2.html'))
+            self.assertEqual(self.titles(item_set), expected)
+
+        self.assertTrue(mock.call_args[1]['stream'])
+        with self.assertRaises(scrapper.ScrapperException):
+            list(item_set)
+
+    def test_nested_elements(self):
+        content = '<html><body><div class="entry"><h1>Outer</h1>' \
+                  '<div class="entry"><h1>Inner</h1></div>' \
+                  '<p>Outer text</p></div></body></html>'
+        item_set = self.streaming_class('http://dummy.org', content=content)
+        item_set.chunk_size = 16
+        items = list(item_set)
+
+        self.assertEqual(
+            [item.title for item in items], ['Outer', 'Inner'],
+        )
+        self.assertEqual(items[0]._content.xpath('//h1/text()'), [
+            'Outer', 'Inner',
+        ])
+
+    def test_items_are_yielded_while_parsing(self):
+        content = '<html><body>%s</body></html>' % ''.join(
+            '<div class="entry"><h1>Entry %d</h1></div>' % entry
+            for entry in range(100)
+        )
+        item_set = self.streaming_class('http://dummy.org', content=content)
+        chunks = []
+
+        def read_chunks(chunks_iter=item_set._chunks()):
+            for chunk in chunks_iter:
+                chunks.append(chunk)
+                yield chunk
+
+        with patch.object(item_set, '_chunks', read_chunks):
+            items = iter(item_set)
+            first = next(items)
+
+            self.assertEqual(first.title, 'Entry 0')
+            self.assertLess(len(chunks), 3)
+            self.assertEqual(
+                [item.title for item in items][-1], 'Entry 99',
+            )
+
 
 class TestPagination(BaseTestCase):
     def test_should_throw_exception(self):
@@ -243,7 +884,7 @@ class TestPagination(BaseTestCase):
 
 class TestFetchDataFunction(BaseTestCase):
     def test_raises_exception(self):
-        with patch('requests.get') as mock:
+        with patch('requests.Session.get') as mock:
             mocked_get = mock.return_value
             mocked_get.status_code = 500
 
@@ -254,16 +895,15 @@ class TestFetchDataFunction(BaseTestCase):
         old_delay = scrapper.FETCH_DATA_DELAY
         scrapper.FETCH_DATA_DELAY = 1.5
 
-        with patch('requests.get') as mock:
+        with patch('requests.Session.get') as mock:
             mocked_get = mock.return_value
             mocked_get.status_code = 200
             mocked_get.content = ''
 
             # first call is without delay
-            scrapper.fetch_data('http://example.org')
-
             start = datetime.now()
             scrapper.fetch_data('http://example.org')
+            scrapper.fetch_data('http://example.org')
 
         delta = datetime.now() - start
         delta = delta.seconds + delta.microseconds / 1000000.0
@@ -273,5 +913,1344 @@ class TestFetchDataFunction(BaseTestCase):
         scrapper.FETCH_DATA_DELAY = old_delay
 
 
+class TestFetcher(BaseTestCase):
+    def test_pool_configuration(self):
+        fetcher = scrapper.Fetcher(pool_connections=2, pool_maxsize=32)
+        adapter = fetcher.session.get_adapter('http://example.org')
+
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+    def test_default_fetcher_is_shared(self):
+        self.assertIs(
+            scrapper.get_default_fetcher(),
+            scrapper.get_default_fetcher(),
+        )
+
+    def test_fetcher_is_passed_to_items(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = 'page_index.html'
+            item_class = TestItemSet
+            links_selector = '//a/@href'
+
+        fetcher = scrapper.Fetcher()
+        with patch.object(fetcher, 'get', wraps=fetcher.get) as mock:
+            item_sets = list(TestPagination(fetcher=fetcher))
+            items = [item for item_set in item_sets for item in item_set]
+
+        self.assertEqual(mock.call_count, 4)
+        self.assertEqual(len(items), 16)
+        self.assertTrue(all(
+            item_set.fetcher is fetcher for item_set in item_sets
+        ))
+        self.assertTrue(all(item._fetcher is fetcher for item in items))
+
+
+class TestStats(LocalServerTestCase):
+    def setUp(self):
+        super(TestStats, self).setUp()
+        self.stats = scrapper.Stats()
+
+        class StatsEntry(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+            upper = scrapper.Field(
+                '//h1/text()', lambda value, _, __: value.upper(),
+            )
+
+        class StatsEntries(scrapper.ItemSet):
+            item_class = StatsEntry
+            content_selector = '//div[@class="entry"]'
+
+        self.item_set_class = StatsEntries
+
+    def test_disabled(self):
+        self.assertIsNone(scrapper.STATS)
+        list(self.item_set_class(
+            self.url('page_1.html'), fetcher=self.fetcher,
+        ))
+        self.assertEqual(self.stats.as_dict()['counters'], {})
+
+    def test_crawl(self):
+        with patch.object(scrapper, 'STATS', self.stats):
+            items = list(self.item_set_class(
+                self.url('page_1.html'), fetcher=self.fetcher,
+            ))
+
+        stats = self.stats.as_dict()
+        with open('./fixtures/page_1.html', 'rb') as fh:
+            size = len(fh.read())
+
+        self.assertEqual(
+            stats['counters'], {'requests': 1, 'bytes': size, 'items': 4},
+        )
+        self.assertEqual(stats['timings']['fetch']['count'], 1)
+        self.assertEqual(stats['timings']['parse']['count'], 1)
+        self.assertEqual(
+            sorted(stats['timings']['field_xpath']),
+            ['StatsEntry.title', 'StatsEntry.upper'],
+        )
+        self.assertEqual(
+            list(stats['timings']['field_callback']), ['StatsEntry.upper'],
+        )
+        self.assertEqual(
+            stats['timings']['field_xpath']['StatsEntry.title']['count'], 4,
+        )
+        self.assertGreater(stats['items_per_second'], 0)
+        self.assertEqual(items[0].upper, items[0].title.upper())
+
+    def test_rate_limiter_sleep(self):
+        limiter = scrapper.RateLimiter(rate=20)
+        with patch.object(scrapper, 'STATS', self.stats):
+            limiter.wait('http://example.org/')
+            limiter.wait('http://example.org/')
+
+        timing = self.stats.as_dict()['timings']['rate_limiter_sleep']
+        self.assertEqual(timing['count'], 1)
+        self.assertAlmostEqual(timing['sum'], 0.05, places=2)
+
+    def test_prometheus(self):
+        self.stats.count('items', 2)
+        self.stats.observe('fetch', 0.5)
+        self.stats.observe('field_xpath', 0.25, 'Entry."title"')
+
+        lines = self.stats.prometheus().splitlines()
+        self.assertEqual(lines[:8], [
+            '# TYPE scrapper_items_total counter',
+            'scrapper_items_total 2',
+            '# TYPE scrapper_fetch_seconds summary',
+            'scrapper_fetch_seconds_count 1',
+            'scrapper_fetch_seconds_sum 0.5',
+            '# TYPE scrapper_field_xpath_seconds summary',
+            'scrapper_field_xpath_seconds_count{field="Entry.\\"title\\""} 1',
+            'scrapper_field_xpath_seconds_sum{field="Entry.\\"title\\""} 0.25',
+        ])
+        self.assertTrue(lines[-1].startswith('scrapper_items_per_second '))
+
+
+class TestProcessPipeline(BaseTestCase):
+    def test_extract(self):
+        documents = []
+        for name in ('page_1.html', 'page_2.html', 'page_3.html'):
+            with open('./fixtures/%s' % name, 'rb') as fh:
+                documents.append((name, fh.read()))
+
+        with scrapper.ProcessPipeline(
+            PipelineEntries, workers=2, batch_size=2, max_pending=1,
+        ) as pipeline:
+            records = list(pipeline.extract(documents))
+
+        self.assertEqual(records, [
+            item.as_dict()
+            for name, content in documents
+            for item in PipelineEntries(name, content=content)
+        ])
+        self.assertEqual(len(records), 16)
+        self.assertEqual(records[0], {'name': 'AUGUSTE EICHMANN'})
+
+    def test_crawl(self):
+        with scrapper.ProcessPipeline(PipelineEntries, workers=2) as pipeline:
+            records = list(pipeline.crawl(PipelinePagination()))
+            single = list(pipeline.crawl(['page_3.html']))
+
+        self.assertEqual(
+            records, list(scrapper.iter_records(PipelinePagination())),
+        )
+        self.assertEqual(single, records[-5:])
+
+    def test_item_class(self):
+        with self.assertRaises(scrapper.ScrapperException):
+            scrapper.ProcessPipeline(object)
+
+
+def serve_pages(pages):
+    # patches ``requests`` to respond with given contents for urls
+    def get(session, url, *args, **kwargs):
+        return type(str('mocked_requests'), (object,), {
+            'content': pages[url], 'status_code': 200,
+        })()
+
+    return patch.object(requests.Session, 'get', get)
+
+
+class TestFingerprintStore(unittest.TestCase):
+    pages = {
+        'http://example.org/%d' % number: '<html><body>'
+        '<div class="entry"><h1>Entry %d</h1></div>'
+        '<div class="entry"><h1>Entry %d</h1></div>'
+        '<a class="page" href="/1">1</a><a class="page" href="/2">2</a>'
+        '</body></html>' % (number, number + 10)
+        for number in (0, 1, 2)
+    }
+
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = 'http://example.org/0'
+            item_class = TestItemSet
+            links_selector = '//a[@class="page"]/@href'
+
+        self.item_class = TestCrawlerClass
+        self.pagination_class = TestPagination
+
+        patcher = serve_pages(self.pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def crawl(self, fingerprints):
+        with patch(
+            'lxml.html.fromstring', wraps=lxml.html.fromstring,
+        ) as mock:
+            records = list(scrapper.iter_records(
+                self.pagination_class(fingerprints=fingerprints),
+            ))
+
+        return records, mock.call_count
+
+    def test_unchanged_pages_are_skipped(self):
+        fingerprints = scrapper.FingerprintStore()
+        records, parsed = self.crawl(fingerprints)
+
+        self.assertEqual(records, [
+            {'title': 'Entry 1'}, {'title': 'Entry 11'},
+            {'title': 'Entry 2'}, {'title': 'Entry 12'},
+        ])
+        self.assertEqual(len(fingerprints), 2)
+
+        cached, cached_parsed = self.crawl(fingerprints)
+        self.assertEqual(cached, records)
+        # only starting page is parsed, to find links
+        self.assertEqual((parsed, cached_parsed), (3, 1))
+        self.assertEqual(fingerprints.changed, 2)
+        self.assertEqual(fingerprints.unchanged, 2)
+
+        self.pages['http://example.org/2'] = self.pages[
+            'http://example.org/2'
+        ].replace('Entry 12', 'Entry 22')
+        self.addCleanup(
+            self.pages.__setitem__, 'http://example.org/2',
+            self.pages['http://example.org/2'].replace('Entry 22', 'Entry 12'),
+        )
+        records, parsed = self.crawl(fingerprints)
+        self.assertEqual(records[-1], {'title': 'Entry 22'})
+        self.assertEqual(parsed, 2)
+
+        fingerprints.emit = 'nothing'
+        records, _ = self.crawl(fingerprints)
+        self.assertEqual(records, [])
+
+    def test_items(self):
+        fingerprints = scrapper.FingerprintStore()
+        self.item_class.fingerprints = fingerprints
+
+        item = self.item_class('http://example.org/1')
+        self.assertIsNotNone(item._content)
+
+        item = self.item_class('http://example.org/1')
+        self.assertIsNone(item._content)
+        self.assertEqual(item.title, 'Entry 1')
+        self.assertEqual(fingerprints.unchanged, 1)
+
+    def test_linked_pages(self):
+        class TestLinksItemSet(scrapper.ItemSet):
+            item_class = self.item_class
+            content_selector = '//a/@href'
+
+        pages = {
+            'http://example.org/': '<html><body><a href="/entry">1</a>'
+                                   '</body></html>',
+            'http://example.org/entry': '<html><body><h1>v1</h1>'
+                                        '</body></html>',
+        }
+        fingerprints = scrapper.FingerprintStore()
+        TestLinksItemSet.fingerprints = fingerprints
+
+        def records():
+            with serve_pages(pages):
+                return list(scrapper.iter_records(
+                    TestLinksItemSet('http://example.org/'),
+                ))
+
+        self.assertEqual(records(), [{'title': 'v1'}])
+        self.assertEqual(records(), [{'title': 'v1'}])
+
+        # listing didn't change, but linked page did
+        pages['http://example.org/entry'] = pages[
+            'http://example.org/entry'
+        ].replace('v1', 'v2')
+        self.assertEqual(records(), [{'title': 'v2'}])
+
+    def test_persistence(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        path = os.path.join(path, 'fingerprints')
+
+        with scrapper.FingerprintStore(path) as fingerprints:
+            records, _ = self.crawl(fingerprints)
+
+        fingerprints = scrapper.FingerprintStore(path)
+        self.assertEqual(self.crawl(fingerprints), (records, 1))
+
+        with self.assertRaises(scrapper.ScrapperException):
+            scrapper.FingerprintStore(emit='everything')
+
+
+class TestDistributedCrawl(BaseTestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.queue = scrapper.SQLiteWorkQueue(
+            os.path.join(path, 'queue.sqlite'), lease_time=0.5,
+            max_attempts=2,
+        )
+        self.addCleanup(self.queue.close)
+
+    def test_crawl(self):
+        coordinator = scrapper.Coordinator(PipelinePagination(), self.queue)
+        self.assertEqual(coordinator.run(), 3)
+        # links are added once
+        self.assertEqual(self.queue.add(['page_1.html', 'page_2.html']), 0)
+
+        workers = [
+            scrapper.Worker(PipelineEntries, self.queue, 'worker-%d' % index)
+            for index in range(2)
+        ]
+        threads = [
+            threading.Thread(target=worker.run, kwargs={'poll_interval': 0})
+            for worker in workers
+        ]
+        for thread in threads:
+            thread.start()
+
+        records = list(coordinator.results(poll_interval=0.01))
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            sorted(records, key=lambda record: record['name']),
+            sorted(
+                scrapper.iter_records(PipelinePagination()),
+                key=lambda record: record['name'],
+            ),
+        )
+        self.assertEqual(sum(worker.processed for worker in workers), 3)
+        self.assertEqual(self.queue.counts()['done'], 3)
+
+    def test_default_name(self):
+        with patch.object(os, 'uname', side_effect=AttributeError):
+            worker = scrapper.Worker(PipelineEntries, self.queue)
+
+        self.assertTrue(worker.name.startswith(socket.gethostname()))
+
+    def test_pages_are_not_kept(self):
+        class TestPagination(scrapper.Pagination):
+            url = 'http://example.org/1'
+            item_class = PipelineEntries
+            next_selector = '//a[@class="next"]/@href'
+
+        with serve_pages(feed_pages(6)):
+            pagination = TestPagination()
+            coordinator = scrapper.Coordinator(pagination, self.queue)
+            self.assertEqual(coordinator.run(), 3)
+
+        self.assertEqual(pagination._fetched, {})
+
+    def test_expired_leases(self):
+        self.queue.add(['page_1.html', 'page_2.html'])
+        self.queue.close_input()
+
+        # worker that leased first page crashed
+        (task_id, url), = self.queue.lease('crashed')
+        self.assertEqual(url, 'page_1.html')
+        self.assertEqual(self.queue.lease('other'), [(2, 'page_2.html')])
+        self.assertEqual(self.queue.lease('other'), [])
+        self.assertFalse(self.queue.finished)
+
+        sleep(0.5)
+        worker = scrapper.Worker(PipelineEntries, self.queue, 'worker')
+        self.assertEqual(worker.run(max_tasks=1), 1)
+        self.assertFalse(self.queue.complete(task_id, 'crashed', [{}]))
+        self.assertEqual(len(self.queue.records()), 4)
+
+    def test_expired_too_many_times(self):
+        self.queue.add(['page_1.html'])
+        self.queue.close_input()
+
+        # url crashes every worker that leases it
+        for _ in range(2):
+            self.assertEqual(len(self.queue.lease('crashed')), 1)
+            sleep(0.5)
+
+        self.assertEqual(self.queue.lease('other'), [])
+        self.assertEqual(
+            self.queue.failures(), [('page_1.html', 'lease expired')],
+        )
+        self.assertTrue(self.queue.finished)
+
+    def test_failures(self):
+        self.queue.add(['missing.html', 'page_1.html'])
+        self.queue.close_input()
+
+        worker = scrapper.Worker(PipelineEntries, self.queue, 'worker')
+        worker.run(poll_interval=0)
+
+        self.assertEqual((worker.processed, worker.failed), (1, 2))
+        self.assertEqual(self.queue.counts()['failed'], 1)
+        self.assertEqual(self.queue.failures()[0][0], 'missing.html')
+        self.assertTrue(self.queue.finished)
+
+
+class TestFrontier(unittest.TestCase):
+    pages = {
+        'http://example.org/%d' % number: '<html><body>'
+        '<div class="entry"><h1>Entry %d</h1></div>'
+        '<a class="next" href="/%d">Next</a>'
+        '<a class="page" href="/1">1</a><a class="page" href="/2?">2</a>'
+        '<a class="page" href="http://EXAMPLE.org:80/2">2</a>'
+        '<a class="page" href="/3">3</a></body></html>' % (
+            number, number % 3 + 1,
+        )
+        for number in (1, 2, 3)
+    }
+
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestPagination(scrapper.Pagination):
+            url = 'http://example.org/1'
+            item_class = TestCrawlerClass
+            next_selector = '//a[@class="next"]/@href'
+
+        self.pagination_class = TestPagination
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            scrapper.normalize_url('HTTP://Example.ORG:80?b=2&a=1#top'),
+            'http://example.org/?a=1&b=2',
+        )
+        self.assertEqual(
+            scrapper.normalize_url('https://example.org:8443/a/?x='),
+            'https://example.org:8443/a/?x=',
+        )
+
+    def test_next_selector_cycle(self):
+        with serve_pages(self.pages):
+            items = list(self.pagination_class(
+                frontier=scrapper.Frontier(),
+            ))
+
+        self.assertEqual(
+            [item.title for item in items], ['Entry 1', 'Entry 2', 'Entry 3'],
+        )
+
+    def test_overlapping_links(self):
+        class TestPagination(self.pagination_class):
+            next_selector = None
+            links_selector = '//a[@class="page"]/@href'
+
+        frontier = scrapper.Frontier()
+        with serve_pages(self.pages):
+            items = list(TestPagination(frontier=frontier))
+
+        self.assertEqual(
+            [item.title for item in items], ['Entry 1', 'Entry 2', 'Entry 3'],
+        )
+        self.assertIn('http://example.org/2', frontier)
+        self.assertEqual(len(frontier.seen), 3)
+
+    def test_resume(self):
+        path = os.path.join(self.path, 'frontier')
+        frontier = scrapper.Frontier(path, checkpoint_every=1)
+
+        with serve_pages(self.pages):
+            for item in self.pagination_class(frontier=frontier):
+                if item.title == 'Entry 2':
+                    # crawl stops while processing second page
+                    break
+
+        # last checkpoint was made after first page was completed
+        frontier = scrapper.Frontier(path)
+        self.assertEqual(list(frontier.pending), ['http://example.org/2'])
+
+        with serve_pages(self.pages), patch.object(
+            scrapper.Fetcher, 'get', autospec=True,
+            side_effect=scrapper.Fetcher.get,
+        ) as mock:
+            items = list(self.pagination_class(frontier=frontier))
+
+        self.assertEqual(
+            [item.title for item in items], ['Entry 2', 'Entry 3'],
+        )
+        self.assertEqual(
+            [call[0][1] for call in mock.call_args_list],
+            ['http://example.org/2', 'http://example.org/3'],
+        )
+
+    def test_hash_set(self):
+        seen = scrapper.HashSet()
+        seen.min_added = 10
+        digests = [scrapper.url_digest('http://example.org/%d' % number)
+                   for number in range(100)]
+        for digest in digests + digests[:20]:
+            seen.add(digest)
+
+        # added digests were merged into array a few times
+        self.assertLessEqual(len(seen._added), 10)
+        self.assertEqual(len(seen), 100)
+        self.assertTrue(all(digest in seen for digest in digests))
+        self.assertNotIn(scrapper.url_digest('http://example.org/'), seen)
+
+        restored = scrapper.HashSet(seen.to_bytes())
+        self.assertEqual(list(restored._digests), sorted(digests))
+
+    def test_bloom_filter(self):
+        path = os.path.join(self.path, 'frontier')
+        frontier = scrapper.Frontier(
+            path, seen=scrapper.BloomFilter(capacity=1000, error_rate=0.01),
+        )
+        for number in range(1000):
+            frontier.add('http://example.org/%d' % number)
+        frontier.checkpoint()
+
+        frontier = scrapper.Frontier(path)
+        false_positives = sum(
+            'http://example.org/other/%d' % number in frontier
+            for number in range(1000)
+        )
+
+        self.assertIsInstance(frontier.seen, scrapper.BloomFilter)
+        # false positives may happen while adding too
+        self.assertEqual(len(frontier.pending), len(frontier.seen))
+        self.assertGreater(len(frontier.pending), 980)
+        self.assertTrue(all(
+            'http://example.org/%d' % number in frontier
+            for number in range(1000)
+        ))
+        self.assertLess(false_positives, 30)
+        self.assertFalse(frontier.add('http://example.org/10'))
+
+
+def feed_pages(newest, per_page=2):
+    # pages of newest-first feed, with entries from ``newest`` to 1
+    numbers = list(range(newest, 0, -1))
+    pages = {}
+    for page, start in enumerate(range(0, len(numbers), per_page), 1):
+        entries = ''.join(
+            '<div class="entry"><h1>Entry %d</h1></div>' % number
+            for number in numbers[start:start + per_page]
+        )
+        if start + per_page < len(numbers):
+            entries += '<a class="next" href="/%d">Next</a>' % (page + 1)
+        pages['http://example.org/%d' % page] = \
+            '<html><body>%s</body></html>' % entries
+
+    return pages
+
+
+class TestIncrementalPagination(unittest.TestCase):
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = 'http://example.org/1'
+            item_class = TestItemSet
+            next_selector = '//a[@class="next"]/@href'
+            seen_field = 'title'
+
+        self.pagination_class = TestPagination
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def crawl(self, pages, seen):
+        fetched = []
+
+        def get(session, url, *args, **kwargs):
+            fetched.append(url)
+            return type(str('mocked_requests'), (object,), {
+                'content': pages[url], 'status_code': 200,
+            })()
+
+        titles = []
+        with patch.object(requests.Session, 'get', get):
+            try:
+                for item_set in self.pagination_class(seen=seen):
+                    titles.extend(item.title for item in item_set)
+            except scrapper.ScrapperCantFindNext:
+                pass
+
+        return titles, len(fetched)
+
+    def test_stops_at_seen_page(self):
+        seen = scrapper.SeenStore()
+        titles, fetched = self.crawl(feed_pages(6), seen)
+        self.assertEqual(titles, ['Entry %d' % n for n in range(6, 0, -1)])
+        self.assertEqual((fetched, len(seen)), (3, 6))
+
+        # one new entry moves others to next pages
+        titles, fetched = self.crawl(feed_pages(7), seen)
+        self.assertEqual(titles, ['Entry 7'])
+        self.assertEqual(fetched, 2)
+
+        titles, fetched = self.crawl(feed_pages(7), seen)
+        self.assertEqual((titles, fetched), ([], 1))
+
+    def test_interrupted_run_is_not_committed(self):
+        seen = scrapper.SeenStore()
+        with serve_pages(feed_pages(6)):
+            for item_set in self.pagination_class(seen=seen):
+                list(item_set)
+                break
+
+        self.assertEqual(len(seen), 0)
+        titles, _ = self.crawl(feed_pages(6), seen)
+        self.assertEqual(len(titles), 6)
+
+    def test_persistence(self):
+        path = os.path.join(self.path, 'seen')
+        self.crawl(feed_pages(4), scrapper.SeenStore(path))
+
+        seen = scrapper.SeenStore(path)
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(
+            self.crawl(feed_pages(5), seen), (['Entry 5'], 2),
+        )
+
+        seen = scrapper.SeenStore(
+            seen=scrapper.BloomFilter(capacity=100),
+        )
+        self.crawl(feed_pages(4), seen)
+        seen.path = path
+        seen.save()
+        self.assertIsInstance(
+            scrapper.SeenStore(path).seen, scrapper.BloomFilter,
+        )
+
+    def test_requires_seen_field(self):
+        self.pagination_class.seen_field = None
+        with serve_pages(feed_pages(2)):
+            with self.assertRaises(scrapper.ScrapperException):
+                self.pagination_class(seen=scrapper.SeenStore())
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = 'page_1.html'
+            item_class = TestItemSet
+            next_selector = '//a[@class="forward"]/@href'
+            prefetch = 1
+
+        self.pagination_class = TestPagination
+        self.fetched = []
+        self.fetching = threading.Event()
+        monkey_patch_requests_get()
+        fixture_get = requests.Session.get
+
+        def get(session, url, *args, **kwargs):
+            self.fetched.append(url)
+            self.fetching.set()
+            return fixture_get(session, url, *args, **kwargs)
+
+        patcher = patch.object(requests.Session, 'get', get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_next_page_is_fetched_in_background(self):
+        titles = []
+        pagination = self.pagination_class()
+        self.fetching.clear()
+        with self.assertRaises(scrapper.ScrapperCantFindNext):
+            for item_set in pagination:
+                if item_set.url == 'page_1.html':
+                    self.assertTrue(self.fetching.wait(5))
+                    self.assertEqual(self.fetched[-1], 'page_2.html')
+
+                titles.extend(item.title for item in item_set)
+
+        self.assertEqual(len(titles), 16)
+        self.assertEqual(
+            self.fetched, ['page_1.html', 'page_2.html', 'page_3.html'],
+        )
+
+    def test_prefetch_depth(self):
+        pagination = self.pagination_class(prefetch=1)
+        self.fetching.clear()
+        items = iter(pagination)
+        next(items)
+
+        # only one page is fetched ahead
+        self.fetching.wait(5)
+        sleep(0.1)
+        self.assertEqual(self.fetched, ['page_1.html', 'page_2.html'])
+        items.close()
+
+    def test_read_ahead(self):
+        def values():
+            yield 1
+            yield 2
+            raise ValueError
+
+        iterator = scrapper.read_ahead(values(), 3)
+        self.assertEqual([next(iterator), next(iterator)], [1, 2])
+        with self.assertRaises(ValueError):
+            next(iterator)
+
+
+class TestSinks(BaseTestCase):
+    def test_json_lines(self):
+        fh = io.StringIO()
+        count = scrapper.export(
+            PipelinePagination(), scrapper.JSONLinesSink(fh),
+        )
+
+        lines = fh.getvalue().splitlines()
+        self.assertEqual(count, 16)
+        self.assertEqual(len(lines), 16)
+        self.assertEqual(json.loads(lines[0]), {'name': 'AUGUSTE EICHMANN'})
+
+    def test_csv(self):
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//div[@class="wrap"]/h1/text()')
+            author = scrapper.Field('//div[@class="wrap"]/a/text()')
+            missing = scrapper.Field('//h6/text()')
+
+        fh = io.StringIO()
+        with scrapper.CSVSink(fh, ['title', 'missing']) as sink:
+            scrapper.export(TestCrawlerClass('single_entry.html'), sink)
+
+        self.assertEqual(fh.getvalue(), 'title,missing\r\nTitle,\r\n')
+
+        # header can't be extended with fields of later records
+        fh = io.StringIO()
+        with self.assertRaises(scrapper.ScrapperException):
+            scrapper.export(
+                iter([{'a': 1}, {'a': 2, 'b': 3}]), scrapper.CSVSink(fh),
+            )
+        self.assertEqual(fh.getvalue(), 'a\r\n1\r\n')
+
+    def test_csv_file(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        filename = os.path.join(path, 'records.csv')
+
+        with scrapper.CSVSink(filename) as sink:
+            scrapper.export(PipelineEntries('page_3.html'), sink)
+
+        with open(filename) as fh:
+            lines = fh.read().splitlines()
+
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[:2], ['name', 'LUKE BINS'])
+
+    def test_buffered(self):
+        fh = io.StringIO()
+        sink = scrapper.BufferedSink(scrapper.JSONLinesSink(fh), flush_size=3)
+
+        for number in range(4):
+            sink.write({'number': number})
+
+        self.assertEqual(len(fh.getvalue().splitlines()), 3)
+        self.assertEqual(sink.count, 4)
+
+        sink.close()
+        self.assertEqual(len(fh.getvalue().splitlines()), 4)
+
+    def test_records(self):
+        fh = io.StringIO()
+        scrapper.export(
+            iter([{'a': 1}, {'a': 2}]), scrapper.JSONLinesSink(fh),
+        )
+
+        self.assertEqual(fh.getvalue(), '{"a": 1}\n{"a": 2}\n')
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_and_rate(self):
+        limiter = scrapper.RateLimiter(rate=10, burst=3)
+
+        delays = [limiter.reserve('http://a.org/%d' % i) for i in range(4)]
+
+        self.assertEqual(delays[:3], [0, 0, 0])
+        self.assertAlmostEqual(delays[3], 0.1, places=2)
+        self.assertEqual(limiter.reserve('http://b.org/'), 0)
+
+    def test_host_limits(self):
+        limiter = scrapper.RateLimiter(
+            rate=1, hosts={'fast.org': (100, 5), 'Slow.org': 0.5},
+        )
+
+        self.assertEqual(
+            [limiter.reserve('http://fast.org/') for _ in range(5)],
+            [0] * 5,
+        )
+        limiter.reserve('http://slow.org/')
+        self.assertAlmostEqual(
+            limiter.reserve('http://slow.org/'), 2, places=2,
+        )
+
+    def test_reservations_from_threads(self):
+        limiter = scrapper.RateLimiter(rate=100)
+        delays = []
+
+        def reserve():
+            delays.append(limiter.reserve('http://example.org/'))
+
+        threads = [threading.Thread(target=reserve) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # starting threads takes time too, so some tokens are refilled
+        self.assertEqual(sorted(delays)[0], 0)
+        self.assertAlmostEqual(max(delays), 0.19, places=1)
+
+    def test_backoff(self):
+        limiter = scrapper.RateLimiter(rate=100, burst=10)
+        limiter.backoff('http://example.org/', 5)
+
+        self.assertGreater(limiter.reserve('http://example.org/a'), 4.9)
+        self.assertEqual(limiter.reserve('http://example.com/'), 0)
+
+    def test_async_wait(self):
+        limiter = scrapper.RateLimiter(rate=20)
+
+        async def wait():
+            return [
+                await limiter.async_wait('http://example.org/')
+                for _ in range(2)
+            ]
+
+        self.assertAlmostEqual(asyncio.run(wait())[1], 0.05, places=2)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(scrapper.parse_retry_after('3'), 3)
+        self.assertEqual(
+            scrapper.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0,
+        )
+        self.assertIsNone(scrapper.parse_retry_after('soon'))
+        self.assertIsNone(scrapper.parse_retry_after(None))
+
+    def test_fetcher_retries_throttled(self):
+        fetcher = scrapper.Fetcher(
+            rate_limiter=scrapper.RateLimiter(rate=1000, burst=10),
+        )
+        responses = [
+            type('Response', (object,), {
+                'status_code': status, 'headers': {'Retry-After': '0'},
+            })()
+            for status in (429, 503, 200)
+        ]
+
+        with patch.object(fetcher, 'get', side_effect=responses) as mock:
+            response = fetcher.fetch('http://example.org/')
+
+        self.assertEqual(mock.call_count, 3)
+        self.assertIs(response, responses[-1])
+
+        fetcher.retry_policy.retries = 0
+        with patch.object(fetcher, 'get', side_effect=responses) as mock:
+            with self.assertRaises(scrapper.ScrapperException):
+                fetcher.fetch('http://example.org/')
+
+
+class FlakyHTTPRequestHandler(QuietHTTPRequestHandler):
+    # ``/fail/<n>/<status>/<path>`` responds with status ``n`` times and then
+    # serves the file, ``/hang/<path>`` responds after a while
+    requests = collections.Counter()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        parts = self.path.split('/')
+        self.requests[self.path] += 1
+        if parts[1] == 'fail' and self.requests[self.path] <= int(parts[2]):
+            self.send_response(int(parts[3]))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if parts[1] == 'hang':
+            sleep(0.5)
+
+        self.path = '/' + parts[-1]
+        super(FlakyHTTPRequestHandler, self).do_GET()
+
+
+class TestResilience(LocalServerTestCase):
+    handler_class = FlakyHTTPRequestHandler
+
+    def setUp(self):
+        super(TestResilience, self).setUp()
+        FlakyHTTPRequestHandler.requests.clear()
+        self.fetcher.rate_limiter = scrapper.RateLimiter(rate=0)
+        self.fetcher.retry_policy = scrapper.RetryPolicy(
+            retries=2, backoff=0.01, timeout=(1, 0.2),
+        )
+
+    def test_retries(self):
+        response = self.fetcher.fetch(self.url('fail/2/500/page_1.html'))
+        self.assertIn(b'Auguste Eichmann', response.content)
+        self.assertEqual(
+            FlakyHTTPRequestHandler.requests['/fail/2/500/page_1.html'], 3,
+        )
+
+        with self.assertRaises(scrapper.ScrapperException):
+            self.fetcher.fetch(self.url('fail/3/502/page_1.html'))
+
+        # client errors aren't repeated
+        with self.assertRaises(scrapper.ScrapperException):
+            self.fetcher.fetch(self.url('fail/1/404/page_1.html'))
+        self.assertEqual(
+            FlakyHTTPRequestHandler.requests['/fail/1/404/page_1.html'], 1,
+        )
+
+    def test_retried_responses_are_closed(self):
+        with patch.object(
+            requests.Response, 'close', autospec=True,
+        ) as close:
+            response = self.fetcher.fetch(
+                self.url('fail/2/503/page_1.html'), stream=True,
+            )
+
+        self.assertEqual(
+            [call[0][0].status_code for call in close.call_args_list],
+            [503, 503],
+        )
+        self.assertIn(b'Auguste Eichmann', response.content)
+
+    def test_timeout(self):
+        with self.assertRaises(scrapper.ScrapperException) as context:
+            self.fetcher.fetch(self.url('hang/page_1.html'))
+
+        self.assertIsInstance(context.exception.__cause__, requests.Timeout)
+        self.assertEqual(
+            FlakyHTTPRequestHandler.requests['/hang/page_1.html'], 3,
+        )
+
+    def test_backoff(self):
+        policy = scrapper.RetryPolicy(backoff=1, max_backoff=3, jitter=0.5)
+        for attempt, (low, high) in enumerate([(1, 1.5), (2, 3), (3, 4.5)]):
+            delay = policy.delay(attempt)
+            self.assertTrue(low <= delay <= high, (attempt, delay))
+
+        response = type('Response', (object,), {
+            'status_code': 429, 'headers': {'Retry-After': '7'},
+        })()
+        self.assertEqual(policy.delay(0, response), 7)
+
+    def test_circuit_breaker(self):
+        breaker = scrapper.CircuitBreaker(threshold=3, reset_timeout=0.2)
+        self.fetcher.circuit_breaker = breaker
+
+        with self.assertRaises(scrapper.ScrapperException):
+            self.fetcher.fetch(self.url('fail/5/503/page_1.html'))
+        self.assertEqual(breaker.state(self.url('')), 'open')
+
+        with self.assertRaises(scrapper.ScrapperCircuitOpen):
+            self.fetcher.fetch(self.url('fail/5/503/page_1.html'))
+        self.assertEqual(
+            FlakyHTTPRequestHandler.requests['/fail/5/503/page_1.html'], 3,
+        )
+
+        sleep(0.2)
+        self.assertEqual(breaker.state(self.url('')), 'half-open')
+        self.fetcher.fetch(self.url('page_1.html'))
+        self.assertEqual(breaker.state(self.url('')), 'closed')
+
+
+class TestResponseCache(LocalServerTestCase):
+    def setUp(self):
+        super(TestResponseCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def fetch(self, cache, path='page_1.html'):
+        self.fetcher.cache = cache
+        with patch.object(
+            self.fetcher, 'get', wraps=self.fetcher.get,
+        ) as mock:
+            response = self.fetcher.fetch(self.url(path))
+
+        return response, mock.call_args_list
+
+    def test_revalidation(self):
+        cache = scrapper.ResponseCache(self.path)
+
+        response, calls = self.fetch(cache)
+        self.assertFalse(getattr(response, 'from_cache', False))
+        self.assertEqual(calls[0][0][1], {})
+
+        cached, calls = self.fetch(cache)
+        self.assertTrue(cached.from_cache)
+        self.assertTrue(cached.not_modified)
+        self.assertEqual(cached.content, response.content)
+        self.assertIn('If-Modified-Since', calls[0][0][1])
+
+        self.assertEqual(
+            cache.counters(),
+            {
+                'hits': 0, 'misses': 1, 'revalidated': 1, 'evictions': 0,
+                'size': cache.size,
+            },
+        )
+
+    def test_fresh_responses(self):
+        cache = scrapper.ResponseCache(self.path, fresh_for=60)
+        response, _ = self.fetch(cache)
+
+        # cache is persisted on disk
+        cache = scrapper.ResponseCache(self.path, fresh_for=60)
+        cached, calls = self.fetch(cache)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(cached.content, response.content)
+        self.assertFalse(cached.not_modified)
+        self.assertEqual(cache.hits, 1)
+        self.assertGreater(cache.size, len(response.content))
+
+    def test_ttl(self):
+        cache = scrapper.ResponseCache(self.path, ttl=-1)
+        self.fetch(cache)
+        _, calls = self.fetch(cache)
+
+        self.assertEqual(calls[0][0][1], {})
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_eviction(self):
+        cache = scrapper.ResponseCache(self.path, max_size=1500)
+        for path in ('page_1.html', 'page_2.html', 'page_3.html'):
+            self.fetch(cache, path)
+            os.utime(
+                cache._filename(cache.key(self.url(path)), 'json'),
+                (1, 1 + cache.misses),
+            )
+
+        self.assertEqual(cache.evictions, 2)
+        self.assertLessEqual(cache.size, 1500)
+        self.assertIsNone(cache.load(cache.key(self.url('page_1.html'))))
+        self.assertIsNotNone(cache.load(cache.key(self.url('page_3.html'))))
+
+    def test_vary(self):
+        cache = scrapper.ResponseCache(self.path)
+
+        self.assertNotEqual(
+            cache.key('http://example.org/', {'Accept': 'text/html'}),
+            cache.key('http://example.org/', {'Accept': 'text/plain'}),
+        )
+        self.assertEqual(
+            cache.key('http://example.org/', {'Accept': 'text/html'}),
+            cache.key('http://example.org/', {
+                'Accept': 'text/html', 'User-Agent': 'scrapper',
+            }),
+        )
+
+
+class TestFanOut(LocalServerTestCase):
+    def setUp(self):
+        super(TestFanOut, self).setUp()
+
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestLinksItemSet(scrapper.ItemSet):
+            item_class = TestItemSet
+            content_selector = '//a/@href'
+            fetcher = self.fetcher
+
+        self.item_class = TestItemSet
+        self.links_class = TestLinksItemSet
+
+    def titles(self, item_sets):
+        return [
+            [item.title for item in item_set]
+            if not isinstance(item_set, Exception) else item_set.url
+            for item_set in item_sets
+        ]
+
+    def test_links(self):
+        url = self.url('page_index.html')
+        expected = self.titles(self.links_class(url))
+        self.assertEqual([len(titles) for titles in expected], [4, 7, 5])
+
+        self.links_class.workers = 2
+        with patch.object(
+            self.fetcher.rate_limiter, 'wait',
+            wraps=self.fetcher.rate_limiter.wait,
+        ) as mock:
+            self.assertEqual(self.titles(self.links_class(url)), expected)
+
+        # every page goes through rate limiter
+        self.assertEqual(mock.call_count, 4)
+
+        self.links_class.ordered = False
+        self.assertEqual(
+            sorted(self.titles(self.links_class(url))), sorted(expected),
+        )
+
+    def test_errors(self):
+        self.links_class.workers = 3
+        content = '<a href="page_1.html"></a><a href="missing.html"></a>' \
+                  '<a href="page_3.html"></a>'
+        item_set = self.links_class(self.url(''), content=content)
+        results = list(item_set)
+
+        self.assertIsInstance(results[1], scrapper.ScrapperItemError)
+        self.assertIsInstance(results[1].error, scrapper.ScrapperException)
+        self.assertEqual(
+            self.titles(results),
+            [
+                self.titles([self.item_class(self.url('page_1.html'))])[0],
+                self.url('missing.html'),
+                self.titles([self.item_class(self.url('page_3.html'))])[0],
+            ],
+        )
+        self.assertEqual(len(list(scrapper.iter_records(item_set))), 9)
+
+    def test_pagination(self):
+        class TestPagination(scrapper.Pagination):
+            url = self.url('page_1.html')
+            item_class = self.item_class
+            next_selector = '//a[@class="forward"]/@href'
+            workers = 2
+
+        result = []
+        with self.assertRaises(scrapper.ScrapperCantFindNext):
+            for item_set in TestPagination(self.fetcher):
+                result.append(self.titles([item_set])[0])
+
+        self.assertEqual([len(titles) for titles in result], [4, 7, 5])
+
+    def test_stopped(self):
+        started = []
+
+        def call(url):
+            started.append(url)
+            sleep(0.05 * (url + 1))
+            return url
+
+        results = scrapper.fan_out(call, ((url,) for url in range(10)), 2)
+        self.assertEqual(next(results), (0, 0))
+        results.close()
+        sleep(0.3)
+
+        # two calls were running, the one waiting in pool is cancelled
+        self.assertEqual(sorted(started), [0, 1, 2])
+
+
+class TestResponseArchive(LocalServerTestCase):
+    def setUp(self):
+        super(TestResponseArchive, self).setUp()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.path = os.path.join(path, 'archive')
+
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        class TestPagination(scrapper.Pagination):
+            url = self.url('page_index.html')
+            item_class = TestItemSet
+            links_selector = '//a/@href'
+
+        self.pagination_class = TestPagination
+
+    def test_record_and_replay(self):
+        item_set_class = self.pagination_class.item_class
+        with scrapper.ResponseArchive(self.path) as archive:
+            self.fetcher.archive = archive
+            records = list(scrapper.iter_records(
+                self.pagination_class(self.fetcher),
+            ))
+            with self.assertRaises(scrapper.ScrapperException):
+                self.fetcher.fetch(self.url('missing.html'))
+
+        self.assertEqual(len(records), 16)
+
+        archive = scrapper.ResponseArchive(self.path)
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 5)
+
+        response = archive.response(self.url('page_1.html'))
+        self.assertIsInstance(response.body, memoryview)
+        self.assertEqual(response.headers['content-type'], 'text/html')
+        with open('./fixtures/page_1.html', 'rb') as fh:
+            self.assertEqual(response.content, fh.read())
+
+        fetcher = scrapper.ReplayFetcher(archive)
+        with patch.object(
+            requests.Session, 'get', side_effect=AssertionError,
+        ):
+            self.assertEqual(
+                list(scrapper.iter_records(self.pagination_class(fetcher))),
+                records,
+            )
+            with self.assertRaises(scrapper.ScrapperException):
+                fetcher.fetch(self.url('missing.html'))
+            with self.assertRaises(scrapper.ScrapperException):
+                fetcher.fetch(self.url('page_4.html'))
+
+            streamed = type('TestStreamed', (item_set_class,), {
+                'streaming': True, 'chunk_size': 64, 'fetcher': fetcher,
+            })
+            self.assertEqual(
+                list(scrapper.iter_records(streamed(self.url('page_2.html')))),
+                records[4:11],
+            )
+
+    def test_interrupted_write(self):
+        with scrapper.ResponseArchive(self.path) as archive:
+            self.fetcher.archive = archive
+            self.fetcher.fetch(self.url('page_1.html'))
+            self.fetcher.fetch(self.url('page_2.html'))
+
+        with open(self.path, 'r+b') as fh:
+            fh.truncate(os.path.getsize(self.path) - 10)
+
+        with scrapper.ResponseArchive(self.path) as archive:
+            self.assertEqual(list(archive.index), [self.url('page_1.html')])
+            self.fetcher.archive = archive
+            self.fetcher.fetch(self.url('page_3.html'))
+            self.assertEqual(
+                archive.response(self.url('page_3.html')).status_code, 200,
+            )
+
+        with scrapper.ResponseArchive(self.path) as archive:
+            self.assertEqual(len(archive), 2)
+
+    def test_iter_content(self):
+        response = scrapper.ArchivedResponse(
+            'http://example.org/', 200, {}, memoryview(b'abcde'),
+        )
+        self.assertEqual(list(response.iter_content(None)), [b'abcde'])
+        self.assertEqual(
+            list(response.iter_content(2)), [b'ab', b'cd', b'e'],
+        )
+
+        response.body = memoryview(b'')
+        self.assertEqual(list(response.iter_content(None)), [])
+        self.assertEqual(list(response.iter_content(2)), [])
+
+    def test_corrupted(self):
+        with open(self.path, 'w') as fh:
+            fh.write('not an archive')
+
+        with self.assertRaises(scrapper.ScrapperException):
+            scrapper.ResponseArchive(self.path)
+        self.assertEqual(os.path.getsize(self.path), 14)
+
+        with scrapper.ResponseArchive(self.path + '2') as archive:
+            self.fetcher.archive = archive
+            self.fetcher.fetch(self.url('page_1.html'))
+            self.fetcher.fetch(self.url('page_2.html'))
+            offset = archive.index[self.url('page_2.html')][0]
+
+        with open(self.path + '2', 'r+b') as fh:
+            fh.seek(offset)
+            fh.write(b'XXXX')
+
+        with self.assertRaises(scrapper.ScrapperException):
+            scrapper.ResponseArchive(self.path + '2')
+        self.assertGreater(os.path.getsize(self.path + '2'), offset)
+
+
+class TestAsyncPagination(LocalServerTestCase):
+    def setUp(self):
+        super(TestAsyncPagination, self).setUp()
+
+        class TestCrawlerClass(scrapper.Item):
+            title = scrapper.Field('//h1/text()')
+
+        class TestItemSet(scrapper.ItemSet):
+            item_class = TestCrawlerClass
+            content_selector = '//div[@class="entry"]'
+
+        self.item_class = TestItemSet
+
+    def collect(self, pagination, result=None, **kwargs):
+        result = [] if result is None else result
+
+        async def collect():
+            async for item_set in pagination.aiter(**kwargs):
+                result.append([item.title for item in item_set])
+
+        asyncio.run(collect())
+        return result
+
+    def test_links_selector(self):
+        class TestPagination(scrapper.Pagination):
+            url = self.url('page_index.html')
+            item_class = self.item_class
+            links_selector = '//a/@href'
+
+        ordered = self.collect(
+            TestPagination(self.fetcher), concurrency=2, ordered=True,
+        )
+        unordered = self.collect(
+            TestPagination(self.fetcher), concurrency=3, per_host=2,
+        )
+
+        self.assertEqual(
+            ordered,
+            [
+                [item.title for item in item_set]
+                for item_set in TestPagination(self.fetcher)
+            ],
+        )
+        self.assertEqual([len(titles) for titles in ordered], [4, 7, 5])
+        self.assertEqual(sorted(ordered), sorted(unordered))
+
+    def test_next_selector(self):
+        class TestPagination(scrapper.Pagination):
+            url = self.url('page_1.html')
+            item_class = self.item_class
+            next_selector = '//a[@class="forward"]/@href'
+
+        pagination = TestPagination(self.fetcher)
+        result = []
+        with patch.object(
+            self.fetcher, 'get', wraps=self.fetcher.get,
+        ) as mock, self.assertRaises(scrapper.ScrapperCantFindNext):
+            self.collect(pagination, result, ordered=True)
+
+        # every page is fetched only once
+        self.assertEqual(mock.call_count, 2)
+        self.assertEqual([len(titles) for titles in result], [4, 7, 5])
+
+
 if __name__ == '__main__':
     unittest.main()